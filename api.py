@@ -1,74 +1,617 @@
-from database import open_connection, close_connection, create_tables, insert_post_data, insert_vote_data, insert_user_data, insert_tag_data, insert_postlink_data, insert_comment_data
-from utils import html_to_markdown2, tags_to_comma_separated, skip_to_line, print_progress
-import re
+from database import open_connection, close_connection, create_tables, create_fulltext, build_fulltext_indexes, open_writer, finish_bulk_load, TagIds, resolve_pending_tags, reset_stats, write_stats_offset, read_stats_offset, merge_stats, is_transient_error, WriteError
+from schema import XML_TYPES, MARKDOWN_COLUMNS, FULLTEXT_COLUMNS, column_index, column_names
+from rowparser import get_row_parser
+from utils import html_to_markdown2, get_markdown_converter, tags_to_comma_separated, print_progress
+from reader import open_dump, seek_to_line, compute_shards, chunk_positions
+from checkpoint import checkpoint_is_stale, read_checkpoint, write_checkpoint
+from metrics import ImportMetrics
+from delta import DeltaTracker
+from filters import RowFilter, projected_columns
+from revisions import RevisionCompactor
+from stats import PostStats, STATS_TABLES, STATS_SOURCE_COLUMNS
+from quarantine import Quarantine, read_quarantine, write_quarantine
+from collections import deque
+import multiprocessing
 import os
+import time
    
-def process_xml_line(conn, line, table, convert_to_md):
-    # Regular expression to match the <row> elements and capture their attributes
-    row_regex = re.compile(r'<row ([^>]+)>')
-    match = row_regex.search(line)
-    if match:
-        attributes_str = match.group(1)
-        # Convert the attributes string to a dictionary
-        attributes = dict(re.findall(r'(\S+)="([^"]*)"', attributes_str))
-        
-        if table == "Votes": 
-            insert_vote_data(conn, attributes)
-        elif table == "Users":
-            if 'AboutMe' in attributes:
-                if convert_to_md == True:
-                    attributes['AboutMe'], error = html_to_markdown2(attributes['AboutMe'])
-                    attributes['Error'] = error
-            insert_user_data(conn, attributes)
-        elif table == "Tags":
-            insert_tag_data(conn, attributes)
-        elif table == "PostLinks":
-            insert_postlink_data(conn, attributes)
-        elif table == 'Posts':
-            if 'Body' in attributes:
-                if convert_to_md == True:
-                    attributes['Body'], error = html_to_markdown2(attributes['Body'])
-                    attributes['Error'] = error
-            if 'Tags' in attributes:   
-                attributes['Tags'] = tags_to_comma_separated(attributes['Tags'])
-            insert_post_data(conn, attributes)
-        elif table == "Comments":   
-            if 'Text' in attributes:
-                if convert_to_md == True:
-                    attributes['Text'], error = html_to_markdown2(attributes['Text']) 
-                    attributes['Error'] = error
-            insert_comment_data(conn, attributes)
-        else:
-            raise ValueError(f"Unknown type: {table}. Data insertion skipped.")
+# Number of lines handed to a worker at once when converting with several processes
+CHUNK_SIZE = 1000
+
+# Seconds before reconnecting after a lost connection, doubled after every failed attempt up to RETRY_MAX_DELAY
+RETRY_DELAY = 1
+RETRY_MAX_DELAY = 60
+
+# Tables of the rows queued with a post whose first column is the Id of the post
+POST_RELATED_TABLES = ('post_tags', 'post_tags_pending')
+
+def parse_xml_line(line, table, convert_to_md, engine='regex', projection=None):
+    """
+    Parse a line of the dump (text or raw bytes) and return the destination table and the
+    row tuple, or None for non-row lines. With a `projection` (see `filters.projected_columns`)
+    the other columns stay None, and Markdown is only converted when its column is projected.
+    """
+    destination = XML_TYPES.get(table)
+    if destination is None:
+        raise ValueError(f"Unknown type: {table}. Data insertion skipped.")
+    row = get_row_parser(destination, engine, projection)(line)
+    if row is None:
+        return None
+
+    markdown_column = MARKDOWN_COLUMNS.get(destination)
+    if markdown_column and convert_to_md == True:
+        position = column_index(destination, markdown_column)
+        if row[position] is not None:
+            # The parser already decoded the XML entities
+            row[position], error = html_to_markdown2(row[position], unescape_entities=False)
+            row[column_index(destination, 'Error')] = error
+    if destination == 'posts':
+        position = column_index(destination, 'Tags')
+        if row[position] is not None:
+            row[position] = tags_to_comma_separated(row[position])
+    return destination, tuple(row)
+
+def add_parsed_row(writer, parsed, tag_ids=None, related=()):
+    """
+    Queue a parsed row together with its `related` (table, row) pairs; posts also get
+    their post_tags rows when `tag_ids` is given.
+    """
+    destination, row = parsed
+    if tag_ids is not None and destination == 'posts':
+        tags = row[column_index('posts', 'Tags')]
+        if tags:
+            related = [*related, *tag_ids.post_tag_rows(row[0], tags)]
+    writer.add(destination, row, related)
+
+def parse_xml_lines(lines, table, convert_to_md, engine='regex', projection=None):
+    """
+    Parse a chunk of raw (bytes) lines; this is the unit of work of the worker processes.
+    The lines are not decoded as a whole: the row parser decodes the values it keeps.
+    Returns the parsed rows, the Markdown converter counters (process id, (hits, misses,
+    seconds)) of the worker and the seconds it took to parse the chunk. A line that cannot
+    be parsed gives (None, error) instead of a row, so one bad row does not lose the chunk.
+    """
+    started_at = time.perf_counter()
+    rows = []
+    for line in lines:
+        try:
+            rows.append(parse_xml_line(line, table, convert_to_md, engine, projection))
+        except Exception as e:
+            rows.append((None, f"{type(e).__name__}: {e}"))
+    return rows, (os.getpid(), get_markdown_converter().counters()), time.perf_counter() - started_at
+
+def parse_in_process(chunks, table, convert_to_md, engine, projection=None):
+    """Parse chunks in this process and yield the same results as `parse_in_workers`."""
+    for lines, line_count, size, positions in chunks:
+        yield (*parse_xml_lines(lines, table, convert_to_md, engine, projection), lines, line_count, size, positions)
+
+def parse_in_workers(pool, chunks, table, convert_to_md, engine, max_pending, projection=None):
+    """
+    Parse chunks in the process pool and yield the results in input order.
+    At most `max_pending` chunks are in flight, so memory stays flat no matter the file size.
+    """
+    pending = deque()
+    for lines, line_count, size, positions in chunks:
+        pending.append((pool.apply_async(parse_xml_lines, (lines, table, convert_to_md, engine, projection)), lines, line_count, size, positions))
+        if len(pending) >= max_pending:
+            result, *chunk = pending.popleft()
+            yield (*result.get(), *chunk)
+    while pending:
+        result, *chunk = pending.popleft()
+        yield (*result.get(), *chunk)
       
-def process_xml_file(path, table, start_line_number, convert_to_md):
+def snapshot_counters(counters):
+    """Return the values of the (object, attribute names) `counters`, leaving out the objects that are None."""
+    return [(target, names, [getattr(target, name) for name in names]) for target, names in counters if target is not None]
+
+def restore_counters(snapshot):
+    """Set the counters of a `snapshot_counters` snapshot back to its values."""
+    for target, names, values in snapshot:
+        for name, value in zip(names, values):
+            setattr(target, name, value)
+
+def snapshot_chunks(chunks, counters, snapshots):
+    """Pass chunks on, appending a snapshot of `counters` to `snapshots` once each is read."""
+    for chunk in chunks:
+        snapshots.append(snapshot_counters(counters))
+        yield chunk
+
+def reconnect(conn, error, retries, max_retries, bulk, journal_mode, label=None):
+    """
+    Open a new connection in place of one that failed with a transient error, waiting
+    RETRY_DELAY seconds before the first attempt and twice as long before every next one.
+    """
+    from colored import fg, attr
+    magenta = fg('magenta')
+    reset = attr('reset')
+    try:
+        conn.close()
+    except Exception:
+        pass
+    while True:
+        delay = min(RETRY_DELAY * 2 ** (retries - 1), RETRY_MAX_DELAY)
+        print(f"{magenta}\n{label + ': ' if label else ''}Database error: {str(error).strip()}; reconnecting in {delay}s (attempt {retries} of {max_retries}).{reset}")
+        time.sleep(delay)
+        try:
+            return open_connection(bulk, journal_mode)
+        except Exception as e:
+            if not is_transient_error(e) or retries >= max_retries:
+                raise
+            error = e
+            retries += 1
+
+def print_quarantine(quarantine):
+    """Print how many rows an import quarantined and the command that imports them again."""
+    from colored import fg, attr
+    red = fg('red')
+    reset = attr('reset')
+    if quarantine.count:
+        print(f"{red}Skipped {quarantine.count} rows ({quarantine.counts['parse']} could not be parsed, {quarantine.counts['write']} rejected by the database), "
+              f"written to {quarantine.path}{f' ({len(quarantine.offsets)} rows with those of earlier runs)' if len(quarantine.offsets) > quarantine.count else ''}{reset}")
+        print(f"{red}Import them again once fixed with: python main.py --replay_quarantine {quarantine.path}{reset}")
+    elif quarantine.offsets:
+        print(f"{red}{len(quarantine.offsets)} rows skipped by earlier runs are in {quarantine.path}; import them again once fixed with: python main.py --replay_quarantine {quarantine.path}{reset}")
+
+def process_xml_file(path, table, start_line_number, convert_to_md, batch_size=1000, commit_every=10000, bulk=False, workers=1, resume=False, shard=None, engine='regex', journal_mode='WAL', metrics_file=None, metrics_interval=10, delta=False, compact_history=False, fulltext=False, columns=None, where=None, post_stats=True, max_retries=8, conn=None, label=None, finish_bulk=True):
+    """
+    Import a dump file into the database; returns whether the import completed.
+    With `shard=(index, count)` only the `index`-th of `count` byte ranges of the file is
+    imported (see `reader.compute_shards`), with its own connection and checkpoint; line
+    numbers then count from the start of the shard.
+    With `metrics_file` the throughput of every stage is appended to it as JSON lines
+    every `metrics_interval` seconds (see `metrics.ImportMetrics`).
+    With `delta` the rows that did not change since the last delta import are skipped
+    before they are parsed (see `delta.DeltaTracker`).
+    With `compact_history` the PostHistory texts of later revisions are stored as deltas
+    against the previous revision (see `revisions.RevisionCompactor`).
+    With `fulltext` the Title/Body of posts and the Text of comments are indexed for
+    `search.search` while they are written (see `database.create_fulltext`).
+    `columns` (comma separated names) only fills those columns and `where` (a list of
+    conditions) only imports the matching rows, checked before parsing (see `filters.py`).
+    With `post_stats` Votes and Comments also count the votes by type and the comments of
+    every post into post_vote_stats and post_comment_stats (see `stats.PostStats`).
+    Rows that cannot be parsed, and rows the database rejects, are written to a quarantine
+    file next to the dump (see `quarantine.Quarantine`) and the import goes on without them:
+    the batch is rolled back and the file read again from the last checkpoint, skipping
+    them. A lost connection is opened again, waiting longer after every failed attempt, and
+    the import also goes on from the last checkpoint; it gives up after `max_retries`
+    restarts without a checkpoint in between that found no new row to skip.
+    An open `conn` is used instead of a new connection, and left open. `label` prefixes
+    the output, and `finish_bulk=False` leaves finishing a bulk load to the caller.
+    """
     from colored import fg, attr
     red = fg('red')
     green = fg('green')
+    magenta = fg('magenta')
     reset = attr('reset')
+
+    destination = XML_TYPES.get(table)
+    if destination is None:
+        # A configuration error, not a bad row: every line would be quarantined
+        raise ValueError(f"Unknown type: {table} (available: {', '.join(XML_TYPES)})")
+    # Invalid conditions or columns raise ValueError before anything is opened
+    row_filter = RowFilter(destination, where) if where else None
+    projection = projected_columns(destination, columns) if columns else None
     
-    conn = open_connection()
+    # The byte range to import, the whole file unless this is a shard
+    start_offset, end_offset = 0, None
+    if shard:
+        start_offset, end_offset = compute_shards(path, shard[1])[shard[0]]
+        label = f"Shard {shard[0] + 1}/{shard[1]}"
+        start_line_number = 1
+
+    # Where the rows added to the writer so far end: the byte offset and number of the
+    # next line and the Id of the last row. Recorded as a checkpoint after every commit.
+    position = {'byte_offset': start_offset, 'line_number': start_line_number, 'last_id': None}
+    checkpoint = None
+    if resume:
+        checkpoint = read_checkpoint(path, shard)
+        if checkpoint and checkpoint_is_stale(path, checkpoint):
+            # The byte offset of another version of the file points anywhere in this one
+            print(f"{magenta}{label + ': ' if label else ''}{path} changed since its checkpoint was written, ignoring the checkpoint and starting over.{reset}")
+            checkpoint = None
+            resume = False
+        if checkpoint:
+            position.update((key, checkpoint[key]) for key in position)
+            print(f"{magenta}{label + ': ' if label else ''}Resuming at line {position['line_number']} (byte {position['byte_offset']}, last Id {position['last_id']}){reset}")
+
+    # The position of the last checkpoint of this run, where a restart reads the file again from,
+    # and the counters of the import at that point, which the restart sets back
+    committed = None
+    committed_counters = None
+    retries = 0
+
+    def save_checkpoint():
+        nonlocal committed, committed_counters, retries
+        if stats:
+            stats.committed()
+        write_checkpoint(path, position['byte_offset'], position['line_number'], position['last_id'], shard=shard)
+        committed = dict(position)
+        committed_counters = read_counters + snapshot_counters(write_counters)
+        retries = 0
+
+    def start_writer(conn):
+        writer = open_writer(conn, batch_size, commit_every, bulk, save_checkpoint)
+        # Commits happen between chunks, where `position` is the end of the rows written
+        writer.autocommit = False
+        if projection:
+            writer.projections[destination] = projection
+        if stats:
+            writer.before_commit = spill_stats
+        return writer
+
+    def spill_stats():
+        # Counters past the memory bound are committed with the rows they count, and the offset they end at
+        if stats.full():
+            stats.write(writer, position['byte_offset'])
+
+    own_connection = conn is None
+    if own_connection:
+        conn = open_connection(bulk, journal_mode)
     create_tables(conn)
+    if fulltext:
+        create_fulltext(conn)
+    # Posts also fill post_tags, with the tag names interned to the Ids of the tags table
+    tag_ids = TagIds(conn) if destination == 'posts' else None
+    
+    tracker = DeltaTracker(conn, destination) if delta else None
+    compactor = RevisionCompactor() if compact_history and destination == 'post_history' else None
+    # Counters of the filters, which run ahead of the rows written, and of the rows written.
+    # The snapshots of the filters are taken as chunks are read and popped as they are written,
+    # so `read_counters` holds their values at `position`
+    filter_counters = [(row_filter, ('kept', 'filtered')), (tracker, ('inserted', 'updated', 'unchanged'))]
+    write_counters = [(compactor, ('full_bytes', 'stored_bytes'))]
+    chunk_snapshots = deque()
+    read_counters = snapshot_counters(filter_counters)
+    stats = None
+    if post_stats and destination in STATS_TABLES:
+        if delta:
+            # Counts can only be added to, not corrected for the rows a delta import updates
+            print(f"{magenta}Not counting {STATS_TABLES[destination]} in a --delta import.{reset}")
+        elif projection and not set(STATS_SOURCE_COLUMNS[destination]) <= set(projection):
+            print(f"{magenta}Not counting {STATS_TABLES[destination]}: --columns leaves out {', '.join(STATS_SOURCE_COLUMNS[destination])}.{reset}")
+        else:
+            stats = PostStats(destination, shard[0] if shard else 0)
+            if not checkpoint and start_line_number <= 1:
+                reset_stats(conn, stats.table, destination, shard)
+    # A resume keeps the rows quarantined before, also when the failed run recorded no checkpoint,
+    # and so does an import past the first line, which goes on where an earlier one stopped
+    quarantine = Quarantine(path, table, shard, append=resume or start_line_number > 1)
+    if stats and checkpoint:
+        counted_until = read_stats_offset(conn, destination, stats.shard_index)
+        if counted_until < position['byte_offset']:
+            # The rows committed since the counters were last written are counted again, without writing them
+            print(f"{magenta}{label + ': ' if label else ''}Counting {stats.table} of the rows from byte {max(counted_until, start_offset)} to the checkpoint.{reset}")
+            count_committed_rows(path, table, stats, max(counted_until, start_offset), position['byte_offset'],
+                                 RowFilter(destination, where) if where else None, quarantine.offsets, engine)
+        else:
+            # A crash between a commit and its checkpoint leaves the rows after the checkpoint counted
+            stats.counted_until = counted_until
+    writer = start_writer(conn)
+    # Rows whose Markdown conversion failed have the Error column set
+    error_position = column_index(destination, 'Error') if 'Error' in column_names(destination) else None
+    # The errors of the rows the database rejected, by Id (of the post for its tags); quarantined when they are read again
+    rejected = {}
+    restarting = False
     
-    # Get the total size of the file in bytes
-    total_bytes = os.path.getsize(path)
     count = 0
-    processed_bytes = 0
     last_percent_printed = None
+    started_at = time.perf_counter()
+    pool = None
+    metrics = None
+    completed = False
     
     try:
-        with open(path, 'r', encoding='utf-8', errors='replace') as file:   
-            processed_bytes = skip_to_line(file, start_line_number)         
-            for line in file:
-                process_xml_line(conn, line, table, convert_to_md)
-                count += 1
-                processed_bytes += len(line.encode('utf-8'))
-                last_percent_printed = print_progress(processed_bytes, total_bytes, last_percent_printed)
+        while True:
+            try:
+                with open_dump(path) as file:
+                    if metrics is None:
+                        # Get the total size of the range (or of the file on disk) in bytes
+                        total_bytes = end_offset - start_offset if shard else file.size
+                        metrics = ImportMetrics(metrics_file, metrics_interval, total_bytes, file=path, table=table, shard=shard[0] if shard else None)
+                    writer.metrics = metrics
+
+                    def processed_bytes():
+                        # Compressed dumps report how far the archive has been read
+                        return file.progress() if file.compressed else position['byte_offset'] - start_offset
+
+                    if restarting or (resume and position['byte_offset']) or shard:
+                        file.seek(position['byte_offset'])
+                    else:
+                        position['byte_offset'] = seek_to_line(file, path, start_line_number)
+                        if stats and start_line_number > 1:
+                            # The counts of the lines before are kept; a --resume of this import counts from here
+                            write_stats_offset(conn, destination, stats.shard_index, position['byte_offset'])
+                    if committed is None:
+                        committed = dict(position)
+                        committed_counters = read_counters + snapshot_counters(write_counters)
+                    chunks = file.chunks(CHUNK_SIZE, end_offset - position['byte_offset'] if shard else None)
+                    if row_filter:
+                        chunks = row_filter.filter(chunks)
+                    if tracker:
+                        chunks = tracker.filter(chunks)
+                    chunks = snapshot_chunks(chunks, filter_counters, chunk_snapshots)
+                    if workers > 1:
+                        # This loop reads the chunks, the pool parses and converts them, and this
+                        # process stays the single writer that inserts the results in file order
+                        pool = pool or multiprocessing.Pool(workers)
+                        results = parse_in_workers(pool, chunks, table, convert_to_md, engine, 2 * workers, projection)
+                    else:
+                        results = parse_in_process(chunks, table, convert_to_md, engine, projection)
+                    for rows, (pid, converter_counters), parse_seconds, lines, line_count, size, positions in results:
+                        metrics.converters[pid] = converter_counters
+                        metrics.seconds['parse'] += parse_seconds
+                        read_counters = chunk_snapshots.popleft()
+                        counted = stats and position['byte_offset'] >= stats.counted_until
+                        for index, parsed in enumerate(rows):
+                            if not parsed:
+                                continue
+                            if parsed[0] is None or (rejected and parsed[1][0] in rejected):
+                                line_index, offset = chunk_positions(lines, positions)[index]
+                                stage, error = ('parse', parsed[1]) if parsed[0] is None else ('write', rejected[parsed[1][0]])
+                                quarantine.add(lines[index], position['line_number'] + line_index, position['byte_offset'] + offset, stage, error)
+                                continue
+                            if compactor:
+                                parsed = (destination, compactor.compact(parsed[1]))
+                            add_parsed_row(writer, parsed, tag_ids, tracker.related_rows(parsed[1]) if tracker else ())
+                            position['last_id'] = parsed[1][0]
+                            if counted:
+                                stats.add(parsed[1])
+                            metrics.rows += 1
+                            if error_position is not None and parsed[1][error_position]:
+                                metrics.conversion_errors += 1
+                        count += line_count
+                        position['line_number'] += line_count
+                        position['byte_offset'] += size
+                        metrics.lines += line_count
+                        metrics.bytes += size
+                        writer.commit_due()
+                        last_percent_printed = print_progress(processed_bytes(), total_bytes, last_percent_printed, label)
+                        if metrics.due(time.perf_counter()):
+                            metrics.emit(processed_bytes())
+                    if stats:
+                        stats.write(writer, position['byte_offset'])
+                    writer.close()
+                break
+            except Exception as e:
+                if not (isinstance(e, WriteError) or is_transient_error(e)):
+                    raise
+                # A restart that finds new rows to skip gets further; only the others count
+                progress = False
+                if isinstance(e, WriteError):
+                    writer.rollback()
+                    failing = writer.failing_rows(e.table, e.rows)
+                    if not failing or (e.table != destination and e.table not in POST_RELATED_TABLES):
+                        raise
+                    progress = any(row[0] not in rejected for row, _ in failing)
+                    rejected.update((row[0], error) for row, error in failing)
+                if not progress:
+                    if retries >= max_retries:
+                        raise
+                    retries += 1
+                if isinstance(e, WriteError):
+                    print(f"{magenta}\n{label + ': ' if label else ''}{len(failing)} rows rejected by the database ({str(failing[0][1]).strip().splitlines()[0]}); "
+                          f"going on from line {committed['line_number']} without them.{reset}")
+                else:
+                    conn = reconnect(conn, e, retries, max_retries, bulk, journal_mode, label)
+                    own_connection = True
+                    committed_rows = writer.committed_rows
+                    writer = start_writer(conn)
+                    writer.committed_rows = committed_rows
+                    if tracker:
+                        tracker.conn = conn
+                # The lines after the checkpoint are read again
+                count -= position['line_number'] - committed['line_number']
+                position.update(committed)
+                restarting = True
+                if stats:
+                    # The counts of the rows after the checkpoint were rolled back with them
+                    stats.discard()
+                if compactor:
+                    # The latest texts may be those of rolled back rows, which later revisions must not refer to
+                    compactor.latest.clear()
+                if tracker:
+                    tracker.hashes.clear()
+                restore_counters(committed_counters)
+                read_counters = snapshot_counters(filter_counters)
+                chunk_snapshots.clear()
+        write_checkpoint(path, position['byte_offset'], position['line_number'], position['last_id'], completed=True, shard=shard)
+        if tracker:
+            tracker.save_watermark()
+        pending_tags = None
+        if destination in ('posts', 'tags'):
+            pending_tags = resolve_pending_tags(conn)
+        if fulltext and destination in FULLTEXT_COLUMNS and finish_bulk and not shard:
+            # The GIN index is built once over the loaded rows instead of updated per row
+            build_fulltext_indexes(conn)
+        if bulk and finish_bulk and not shard:
+            # Sharded imports finish the bulk load once all shards are done
+            finish_bulk_load(conn)
+        metrics.emit(total_bytes, final=True, **({'delta': tracker.counts()} if tracker else {}),
+                     **({'filtered_rows': row_filter.filtered} if row_filter else {}),
+                     **({'quarantined_rows': quarantine.count} if quarantine.count else {}))
     except Exception as e:
-        print(f"{red}\nAn error occurred: {e}{reset}")
+        print(f"{red}\n{label + ': ' if label else ''}An error occurred: {e}{reset}")
+        try:
+            # The rows after the last checkpoint are read again by --resume; committing them
+            # here would leave a checkpoint behind rows of the chunk that was cut short
+            writer.rollback()
+        except Exception:
+            pass
+        if metrics:
+            metrics.emit(position['byte_offset'] - start_offset, final=True, error=str(e))
+        print_quarantine(quarantine)
+        print(f"{red}Run again with --resume to continue from the last checkpoint.{reset}")
     else:
-        print_progress(total_bytes, total_bytes, last_percent_printed)
-        print(f"\n{green}Processing completed.{reset}")
+        completed = True
+        print_progress(total_bytes, total_bytes, last_percent_printed, label)
+        print(f"\n{green}{label + ': ' if label else ''}Processing completed.{reset}")
         print(f"{green}Number of processed lines: {count}{reset}")  
+        elapsed = time.perf_counter() - started_at
+        # Committed rows of the table itself, not its tags, hashes or stats, nor rows rolled back by a restart
+        rows_written = writer.committed_rows.get(destination, 0)
+        print(f"{green}Rows written: {rows_written} in {elapsed:.1f}s ({rows_written / max(elapsed, 1e-9):.0f} rows/sec, {type(writer).__name__}){reset}")
+        hits = sum(counters[0] for counters in metrics.converters.values())
+        lookups = hits + sum(counters[1] for counters in metrics.converters.values())
+        if lookups:
+            print(f"{green}Markdown cache hit rate: {100 * hits / lookups:.1f}% ({hits} of {lookups} conversions){reset}")
+        if row_filter:
+            print(f"{green}Filter: {row_filter.kept} rows kept, {row_filter.filtered} rows filtered out by --where{reset}")
+        if tracker:
+            print(f"{green}Delta: {tracker.inserted} rows inserted, {tracker.updated} updated, {tracker.unchanged} unchanged{reset}")
+            if tracker.watermark:
+                print(f"{green}LastActivityDate watermark: {tracker.previous_watermark or 'none'} -> {tracker.new_watermark()}{reset}")
+        if stats:
+            print(f"{green}Post stats: {stats.written_posts} post counters added to {stats.table}{reset}")
+        if compactor and compactor.full_bytes:
+            print(f"{green}PostHistory texts: {compactor.stored_bytes / 1e6:.1f} MB stored for {compactor.full_bytes / 1e6:.1f} MB of revisions ({100 * compactor.stored_bytes / compactor.full_bytes:.1f}%){reset}")
+        if metrics.conversion_errors:
+            print(f"{red}Markdown conversion errors: {metrics.conversion_errors}{reset}")
+        if pending_tags:
+            print(f"{magenta}{pending_tags} post tags name a tag that is not in the tags table yet; they move to post_tags when Tags is imported.{reset}")
+        print_quarantine(quarantine)
     finally:      
-        close_connection(conn)        
\ No newline at end of file
+        if pool:
+            pool.terminate()
+        if own_connection:
+            close_connection(conn)
+    return completed
+
+def count_committed_rows(path, table, stats, start_offset, end_offset, row_filter=None, skipped_offsets=(), engine='regex'):
+    """
+    Count the rows of a dump file between two byte offsets into `stats` (see `stats.PostStats`)
+    without writing them: the rows a resumed import committed before its checkpoint but whose
+    counters were not written yet. Only the columns of the counters are parsed; the rows at
+    `skipped_offsets`, i.e. those quarantined, were not written and are not counted.
+    """
+    projection = projected_columns(stats.source, ','.join(STATS_SOURCE_COLUMNS[stats.source]))
+    offset = start_offset
+    with open_dump(path) as file:
+        file.seek(start_offset)
+        chunks = file.chunks(CHUNK_SIZE, end_offset - start_offset)
+        if row_filter:
+            chunks = row_filter.filter(chunks)
+        for rows, _, _, lines, _, size, positions in parse_in_process(chunks, table, False, engine, projection):
+            offsets = [offset + line_offset for _, line_offset in chunk_positions(lines, positions)] if skipped_offsets else None
+            for index, parsed in enumerate(rows):
+                if parsed and parsed[0] is not None and not (offsets and offsets[index] in skipped_offsets):
+                    stats.add(parsed[1])
+            offset += size
+            # The rows are committed already; nothing takes their counts back
+            stats.committed()
+
+def shard_completed(path, shard):
+    """Return True when the last import of a shard of a dump file ran to the end of the current file."""
+    checkpoint = read_checkpoint(path, shard)
+    return bool(checkpoint and checkpoint.get('completed') and not checkpoint_is_stale(path, checkpoint))
+
+def process_xml_file_sharded(path, table, shards, convert_to_md, **options):
+    """Import a dump file with one process per shard, each ingesting its own byte range."""
+    from colored import fg, attr
+    green = fg('green')
+    reset = attr('reset')
+
+    bulk = options.get('bulk', False)
+    # Create the tables once before the shards start writing to them
+    conn = open_connection(bulk, options.get('journal_mode', 'WAL'))
+    create_tables(conn)
+    if options.get('fulltext'):
+        create_fulltext(conn)
+    close_connection(conn)
+
+    started_at = time.perf_counter()
+    processes = []
+    for index in range(shards):
+        process = multiprocessing.Process(
+            target=process_xml_file,
+            args=(path, table, 1, convert_to_md),
+            kwargs=dict(options, shard=(index, shards)),
+        )
+        process.start()
+        processes.append(process)
+    for process in processes:
+        process.join()
+    finish_shards(path, table, shards, bulk, options.get('fulltext', False), options.get('post_stats', True), options.get('delta', False))
+    print(f"{green}All {shards} shards finished in {time.perf_counter() - started_at:.1f}s.{reset}")
+
+def finish_shards(path, table, shards, bulk=False, fulltext=False, post_stats=True, delta=False):
+    """
+    Finish a sharded import once every shard ran to the end of the file, whoever ran them
+    (`process_xml_file_sharded`, or the tasks of a Slurm array job): merge the post stats of
+    the shards, build the full-text indexes and finish the bulk load. Returns whether it did.
+    """
+    from colored import fg, attr
+    red = fg('red')
+    green = fg('green')
+    reset = attr('reset')
+
+    unfinished = [index for index in range(shards) if not shard_completed(path, (index, shards))]
+    if unfinished:
+        # The finished shards keep their stats rows until the others are resumed
+        print(f"{red}{len(unfinished)} of {shards} shards did not finish (shard index {', '.join(str(index) for index in unfinished)}); "
+              f"import them with --resume, then run --finish_shards.{reset}")
+        return False
+    destination = XML_TYPES.get(table)
+    conn = open_connection()
+    try:
+        if post_stats and destination in STATS_TABLES and not delta:
+            # One row per post
+            merge_stats(conn, STATS_TABLES[destination])
+        if fulltext:
+            build_fulltext_indexes(conn)
+        if bulk:
+            finish_bulk_load(conn)
+    finally:
+        close_connection(conn)
+    print(f"{green}Finished the {shards} shards of {path}.{reset}")
+    return True
+
+def replay_quarantine(quarantine_file, convert_to_md=True, engine='regex', post_stats=True):
+    """
+    Import the rows of a quarantine file (see `quarantine.Quarantine`) again, e.g. once the
+    parser or the database is fixed, each in its own transaction. The rows that fail again
+    stay in the file with their new error; the file is deleted once all rows are imported.
+    Votes and comments are counted into the stats tables of shard 0. Returns the number of
+    rows imported.
+    """
+    from colored import fg, attr
+    red = fg('red')
+    green = fg('green')
+    reset = attr('reset')
+
+    entries = read_quarantine(quarantine_file)
+    conn = open_connection()
+    create_tables(conn)
+    # A batch and a commit per row, so a failing row is the only one rolled back
+    writer = open_writer(conn, 1, 1)
+    tag_ids = TagIds(conn) if any(XML_TYPES.get(entry['type']) == 'posts' for entry in entries) else None
+    stats = {}
+    remaining = []
+    imported = 0
+    try:
+        for entry in entries:
+            try:
+                parsed = parse_xml_line(entry['line'].encode('utf-8', errors='surrogateescape'), entry['type'], convert_to_md, engine)
+                if parsed:
+                    add_parsed_row(writer, parsed, tag_ids)
+                    writer.commit()
+            except Exception as e:
+                if is_transient_error(e):
+                    raise
+                writer.rollback()
+                error = e.error if isinstance(e, WriteError) else e
+                remaining.append(dict(entry, error=f"{type(error).__name__}: {error}"))
+                continue
+            imported += 1
+            if parsed and post_stats and parsed[0] in STATS_TABLES:
+                stats.setdefault(parsed[0], PostStats(parsed[0])).add(parsed[1])
+        for counters in stats.values():
+            counters.write(writer)
+        writer.close()
+    finally:
+        close_connection(conn)
+    write_quarantine(quarantine_file, remaining)
+    print(f"{green}Imported {imported} of {len(entries)} quarantined rows.{reset}")
+    if remaining:
+        print(f"{red}{len(remaining)} rows failed again and stay in {quarantine_file}.{reset}")
+    return imported
@@ -0,0 +1,172 @@
+"""
+Benchmark of the import stages per table: parsing, Markdown conversion and inserts into
+SQLite and, with --postgres_env, a local Postgres. The input is a synthetic dump made
+by `benchmarks.generate_dump` (generated on the fly unless --input is given). Results
+are written to a JSON file, and --compare prints the change against an earlier one:
+
+    python -m benchmarks.bench_import --posts 20000 --output benchmarks/baseline.json
+    python -m benchmarks.bench_import --posts 20000 --output new.json --compare benchmarks/baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# The tables in import order (tags before posts, so post_tags can be filled)
+TABLES = ('Tags', 'Users', 'Posts', 'Comments', 'Votes', 'PostLinks')
+
+def read_lines(path):
+    with open(path, 'rb') as file:
+        return [line.decode('utf-8', errors='replace') for line in file]
+
+def measure_parse(lines, table, engine):
+    """Parse every line without converting to Markdown; returns the rows and the rows/sec."""
+    from api import parse_xml_line
+    started_at = time.perf_counter()
+    rows = [parsed for parsed in (parse_xml_line(line, table, False, engine) for line in lines) if parsed]
+    return rows, len(rows) / (time.perf_counter() - started_at)
+
+def measure_convert(rows):
+    """Convert the Markdown column of the parsed rows with a fresh converter; returns the rows/sec or None."""
+    from schema import MARKDOWN_COLUMNS, column_index
+    from utils import MarkdownConverter
+    if not rows or rows[0][0] not in MARKDOWN_COLUMNS:
+        return None
+    destination = rows[0][0]
+    position = column_index(destination, MARKDOWN_COLUMNS[destination])
+    texts = [row[position] for _, row in rows if row[position] is not None]
+    converter = MarkdownConverter()
+    started_at = time.perf_counter()
+    for text in texts:
+        converter.convert(text)
+    return len(rows) / (time.perf_counter() - started_at)
+
+def insert_all(environment, input_folder, engine, batch_size, commit_every, bulk, results):
+    """
+    Insert every table into an empty database with the writer of the import and put the
+    rows/sec per table into the `results` queue. Runs in its own process so the DBMS of
+    `environment` is read fresh by `database`.
+    """
+    os.environ.update(environment)
+    from api import parse_xml_line, add_parsed_row
+    from database import get_dbms, get_cursor, open_connection, close_connection, create_tables, open_writer, TagIds
+    conn = open_connection(bulk)
+    if get_dbms() == 'POSTGRES':
+        # A schema of its own keeps the benchmark away from the imported tables
+        get_cursor(conn).execute("DROP SCHEMA IF EXISTS benchmark CASCADE; CREATE SCHEMA benchmark; SET search_path TO benchmark")
+    create_tables(conn)
+    rates = {}
+    try:
+        for table in TABLES:
+            lines = read_lines(os.path.join(input_folder, f'{table}.xml'))
+            rows = [parsed for parsed in (parse_xml_line(line, table, False, engine) for line in lines) if parsed]
+            tag_ids = TagIds(conn) if table == 'Posts' else None
+            writer = open_writer(conn, batch_size, commit_every, bulk)
+            started_at = time.perf_counter()
+            for parsed in rows:
+                add_parsed_row(writer, parsed, tag_ids)
+            writer.close()
+            rates[table] = len(rows) / (time.perf_counter() - started_at)
+    finally:
+        if get_dbms() == 'POSTGRES':
+            get_cursor(conn).execute("DROP SCHEMA benchmark CASCADE")
+        close_connection(conn)
+    results.put(rates)
+
+def measure_inserts(environment, input_folder, engine, batch_size, commit_every, bulk):
+    # Spawn, so the child imports `database` again with the DBMS of `environment`
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=insert_all, args=(environment, input_folder, engine, batch_size, commit_every, bulk, results))
+    process.start()
+    rates = results.get()
+    process.join()
+    return rates
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path):
+    """Print the rows/sec of every measure next to the baseline and the change in percent."""
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = json.load(file)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    print(f"{'table':<10} {'measure':<28} {'baseline':>12} {'current':>12} {'change':>8}")
+    for table, measures in results['tables'].items():
+        for name, value in measures.items():
+            if not name.endswith('_per_sec'):
+                continue
+            before = baseline['tables'].get(table, {}).get(name)
+            if value is None or not before:
+                continue
+            print(f"{table:<10} {name:<28} {before:>12.0f} {value:>12.0f} {100 * (value / before - 1):>+7.1f}%")
+
+def main(args):
+    input_folder = args.input
+    temporary = None
+    if not input_folder:
+        from benchmarks.generate_dump import generate
+        temporary = tempfile.TemporaryDirectory()
+        input_folder = temporary.name
+        generate(input_folder, posts=args.posts, body_size=args.body_size, seed=args.seed)
+
+    tables = {}
+    for table in TABLES:
+        lines = read_lines(os.path.join(input_folder, f'{table}.xml'))
+        rows, parse_rate = measure_parse(lines, table, args.parser)
+        tables[table] = {'rows': len(rows), 'parse_rows_per_sec': parse_rate, 'convert_rows_per_sec': measure_convert(rows)}
+        print(f"{table:<10} parse {parse_rate:>10.0f} rows/sec" + (f", convert {tables[table]['convert_rows_per_sec']:>8.0f} rows/sec" if tables[table]['convert_rows_per_sec'] else ''))
+
+    backends = {'SQLITE': {'DBMS': 'SQLITE', 'DB_PATH': os.path.join(tempfile.gettempdir(), f'benchmark-{os.getpid()}.db')}}
+    if args.postgres_env:
+        from dotenv import dotenv_values
+        backends['POSTGRES'] = {**{key: value for key, value in dotenv_values(args.postgres_env).items() if value is not None}, 'DBMS': 'POSTGRES'}
+    for backend, environment in backends.items():
+        try:
+            rates = measure_inserts(environment, input_folder, args.parser, args.batch_size, args.commit_every, args.bulk)
+        finally:
+            if backend == 'SQLITE' and os.path.exists(environment['DB_PATH']):
+                os.remove(environment['DB_PATH'])
+        for table, rate in rates.items():
+            tables[table][f'insert_{backend.lower()}_rows_per_sec'] = rate
+            print(f"{table:<10} insert into {backend:<8} {rate:>10.0f} rows/sec")
+
+    results = {
+        'commit': git_commit(),
+        'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'settings': {'posts': args.posts, 'body_size': args.body_size, 'seed': args.seed, 'input': args.input, 'parser': args.parser,
+                     'batch_size': args.batch_size, 'commit_every': args.commit_every, 'bulk': args.bulk},
+        'tables': tables,
+    }
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        compare(results, args.compare)
+    if temporary:
+        temporary.cleanup()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Parse, convert and insert benchmark on a synthetic dump')
+    parser.add_argument('--input', type=str, help='Folder with the six XML files; by default a synthetic dump is generated in a temporary folder')
+    parser.add_argument('--posts', type=int, default=20000, help='Number of posts of the generated dump (default is 20000)')
+    parser.add_argument('--body_size', type=int, default=1000, help='Average size of the generated post bodies (default is 1000)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the generated dump (default is 42)')
+    parser.add_argument('--parser', type=str, default='regex', help='Row parser engine (default is regex)')
+    parser.add_argument('--batch_size', type=int, default=1000, help='Rows per batch of the inserts (default is 1000)')
+    parser.add_argument('--commit_every', type=int, default=10000, help='Rows per transaction of the inserts (default is 10000)')
+    parser.add_argument('--bulk', action='store_true', help='Insert with the bulk load settings and writers')
+    parser.add_argument('--postgres_env', type=str, help='Environment file with the DB_* settings of a local Postgres to benchmark as well')
+    parser.add_argument('--output', type=str, default='benchmark.json', help='JSON file the results are written to (default is benchmark.json)')
+    parser.add_argument('--compare', type=str, help='JSON file of an earlier run to compare the results with')
+    main(parser.parse_args())
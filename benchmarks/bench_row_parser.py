@@ -0,0 +1,53 @@
+"""
+Micro-benchmark of the row parser engines.
+Run from the repository root:
+
+    python -m benchmarks.bench_row_parser --rows 50000
+"""
+import argparse
+import re
+import time
+from rowparser import ENGINES, get_row_parser
+
+# One representative row per table, taken from the shape of the Stack Overflow dump
+SAMPLE_ROWS = {
+    'posts': '  <row Id="{id}" PostTypeId="1" AcceptedAnswerId="7" CreationDate="2008-07-31T21:42:52.667" Score="630" ViewCount="42817" Body="&lt;p&gt;I want to use a &lt;code&gt;Track-Bar&lt;/code&gt; to change a &lt;code&gt;Form&lt;/code&gt;\'s opacity.&lt;/p&gt;&#xA;&lt;pre&gt;&lt;code&gt;decimal trans = trackBar1.Value / 5000;&#xA;this.Opacity = trans;&#xA;&lt;/code&gt;&lt;/pre&gt;&#xA;" OwnerUserId="8" LastEditorUserId="3072350" LastEditorDisplayName="Rich B" LastEditDate="2021-02-26T03:31:15.027" LastActivityDate="2021-11-15T21:15:29.713" Title="How to convert Decimal to Double in C#?" Tags="&lt;c#&gt;&lt;floating-point&gt;&lt;type-conversion&gt;&lt;double&gt;&lt;decimal&gt;" AnswerCount="13" CommentCount="4" FavoriteCount="0" CommunityOwnedDate="2012-10-31T16:42:47.213" ContentLicense="CC BY-SA 4.0" />\n',
+    'comments': '  <row Id="{id}" PostId="35314" Score="39" Text="not sure why this is getting downvoted -- it is correct! Double check it in your compiler if you don\'t believe him!" CreationDate="2008-09-06T08:07:10.730" UserId="1" ContentLicense="CC BY-SA 2.5" />\n',
+    'postlinks': '  <row Id="{id}" CreationDate="2010-04-26T02:59:48.130" PostId="109" RelatedPostId="32412" LinkTypeId="1" />\n',
+    'tags': '  <row Id="{id}" TagName=".net" Count="332486" ExcerptPostId="3624959" WikiPostId="3607476" />\n',
+    'users': '  <row Id="{id}" Reputation="1" CreationDate="2008-07-31T00:00:00.000" DisplayName="Community" LastAccessDate="2008-08-26T00:16:53.810" WebsiteUrl="https://meta.stackexchange.com/" Location="on the server farm" AboutMe="&lt;p&gt;Hi, I\'m not really a person.&lt;/p&gt;&#xA;" Views="649" UpVotes="506468" DownVotes="1335064" AccountId="-1" />\n',
+    'votes': '  <row Id="{id}" PostId="1" VoteTypeId="2" CreationDate="2008-07-31T00:00:00.000" />\n',
+}
+
+def legacy_parse(line):
+    """The parser used before the row parser engines: a dictionary of raw values that are not decoded yet."""
+    row_regex = re.compile(r'<row ([^>]+)>')
+    match = row_regex.search(line)
+    if match:
+        return dict(re.findall(r'(\S+)="([^"]*)"', match.group(1)))
+    return None
+
+def measure(parse, lines):
+    started_at = time.perf_counter()
+    for line in lines:
+        parse(line)
+    return len(lines) / (time.perf_counter() - started_at)
+
+def main(rows, engines):
+    print(f"{'table':<10} " + ' '.join(f"{name:>12}" for name in ['legacy'] + engines) + '   (rows/sec)')
+    for table, template in SAMPLE_ROWS.items():
+        lines = [template.format(id=i) for i in range(1, rows + 1)]
+        results = [measure(legacy_parse, lines)]
+        for engine in engines:
+            try:
+                results.append(measure(get_row_parser(table, engine), lines))
+            except ImportError:
+                results.append(float('nan'))
+        print(f"{table:<10} " + ' '.join(f"{value:>12.0f}" for value in results))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Row parser micro-benchmark')
+    parser.add_argument('--rows', type=int, default=50000, help='Number of rows parsed per table (default is 50000)')
+    parser.add_argument('--engines', type=str, default=','.join(ENGINES), help='Comma separated engines to compare')
+    args = parser.parse_args()
+    main(args.rows, args.engines.split(','))
@@ -0,0 +1,152 @@
+"""
+Benchmark of the `--fulltext` index against the LIKE scan it replaces: the insert rate
+of Posts and Comments with and without the index, and the latency of keyword queries
+with `search.search` and with `search.search_like`, on SQLite and, with --postgres_env,
+a local Postgres. The input is a synthetic dump made by `benchmarks.generate_dump`:
+
+    python -m benchmarks.bench_search --posts 20000 --output search.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+TABLES = ('Posts', 'Comments')
+# Common words, and a rare one (a number like those of the generated links) that LIKE can only rule out with a full scan
+QUERIES = ('database query', 'memory performance', 'python thread', 'server error', 'javascript array', 'value', '48213')
+
+def load(conn, rows, fulltext, batch_size, commit_every):
+    """Insert the parsed rows of every table into empty tables; returns the rows/sec per table."""
+    from api import add_parsed_row
+    from database import create_tables, create_fulltext, build_fulltext_indexes, open_writer
+    create_tables(conn)
+    if fulltext:
+        create_fulltext(conn)
+    rates = {}
+    for table in TABLES:
+        writer = open_writer(conn, batch_size, commit_every)
+        started_at = time.perf_counter()
+        for parsed in rows[table]:
+            add_parsed_row(writer, parsed)
+        writer.close()
+        if fulltext:
+            # Part of the load on POSTGRES, a no-op on SQLITE
+            build_fulltext_indexes(conn)
+        rates[table] = len(rows[table]) / (time.perf_counter() - started_at)
+    return rates
+
+def measure_queries(conn, function, repeat):
+    """
+    Return the median milliseconds of every query of `QUERIES` for posts and comments and
+    the number of matches, for the first 20 and for all matches. A LIMIT lets LIKE stop
+    scanning early on common words, while ranking always reads every match.
+    """
+    latencies = {}
+    for table in ('posts', 'comments'):
+        for query in QUERIES:
+            for limit in (20, None):
+                seconds = []
+                for _ in range(repeat):
+                    started_at = time.perf_counter()
+                    matches = function(conn, query, limit, table)
+                    seconds.append(time.perf_counter() - started_at)
+                latencies[f"{table}: {query} ({'top 20' if limit else 'all'})"] = {'ms': 1000 * statistics.median(seconds), 'matches': len(matches)}
+    return latencies
+
+def reset(conn, environment):
+    """Return a connection to an empty database: a new SQLite file or a fresh POSTGRES schema."""
+    from database import get_dbms, get_cursor, open_connection, close_connection
+    if get_dbms() == 'POSTGRES':
+        # A schema of its own keeps the benchmark away from the imported tables
+        get_cursor(conn).execute("DROP SCHEMA IF EXISTS benchmark CASCADE; CREATE SCHEMA benchmark; SET search_path TO benchmark")
+        conn.commit()
+        return conn
+    if conn is not None:
+        close_connection(conn)
+    if os.path.exists(environment['DB_PATH']):
+        os.remove(environment['DB_PATH'])
+    return open_connection()
+
+def run_backend(environment, input_folder, batch_size, commit_every, repeat, results):
+    """Load the dump without and with the index and time the queries; runs in its own process so DBMS is read fresh."""
+    os.environ.update(environment)
+    from api import parse_xml_line
+    from database import get_dbms, get_cursor, open_connection, close_connection
+    from search import search, search_like
+    rows = {}
+    for table in TABLES:
+        with open(os.path.join(input_folder, f'{table}.xml'), 'rb') as file:
+            rows[table] = [parsed for parsed in (parse_xml_line(line.decode('utf-8'), table, False) for line in file) if parsed]
+    conn = open_connection() if get_dbms() == 'POSTGRES' else None
+    try:
+        conn = reset(conn, environment)
+        like_rates = load(conn, rows, False, batch_size, commit_every)
+        like = measure_queries(conn, search_like, repeat)
+        conn = reset(conn, environment)
+        fulltext_rates = load(conn, rows, True, batch_size, commit_every)
+        fulltext = measure_queries(conn, search, repeat)
+    finally:
+        if get_dbms() == 'POSTGRES':
+            get_cursor(conn).execute("DROP SCHEMA benchmark CASCADE")
+        close_connection(conn)
+        if get_dbms() == 'SQLITE' and os.path.exists(environment['DB_PATH']):
+            os.remove(environment['DB_PATH'])
+    results.put({
+        'insert_rows_per_sec': {table: {'without_index': like_rates[table], 'fulltext': fulltext_rates[table]} for table in TABLES},
+        'queries': {name: {'like': like[name], 'fulltext': fulltext[name]} for name in like},
+    })
+
+def measure_backend(environment, input_folder, batch_size, commit_every, repeat):
+    # Spawn, so the child imports `database` again with the DBMS of `environment`
+    context = multiprocessing.get_context('spawn')
+    results = context.Queue()
+    process = context.Process(target=run_backend, args=(environment, input_folder, batch_size, commit_every, repeat, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+def main(args):
+    input_folder = args.input
+    temporary = None
+    if not input_folder:
+        from benchmarks.generate_dump import generate
+        temporary = tempfile.TemporaryDirectory()
+        input_folder = temporary.name
+        generate(input_folder, posts=args.posts, body_size=args.body_size, seed=args.seed)
+
+    backends = {'SQLITE': {'DBMS': 'SQLITE', 'DB_PATH': os.path.join(tempfile.gettempdir(), f'benchmark-search-{os.getpid()}.db')}}
+    if args.postgres_env:
+        from dotenv import dotenv_values
+        backends['POSTGRES'] = {**{key: value for key, value in dotenv_values(args.postgres_env).items() if value is not None}, 'DBMS': 'POSTGRES'}
+    results = {'settings': {'posts': args.posts, 'body_size': args.body_size, 'seed': args.seed, 'input': args.input, 'repeat': args.repeat}, 'backends': {}}
+    for backend, environment in backends.items():
+        result = measure_backend(environment, input_folder, args.batch_size, args.commit_every, args.repeat)
+        results['backends'][backend] = result
+        for table, rates in result['insert_rows_per_sec'].items():
+            print(f"{backend:<8} insert {table:<10} {rates['without_index']:>10.0f} rows/sec without index, {rates['fulltext']:>10.0f} with --fulltext")
+        for name, measures in result['queries'].items():
+            like, fulltext = measures['like'], measures['fulltext']
+            print(f"{backend:<8} {name:<38} LIKE {like['ms']:>9.2f} ms ({like['matches']:>5} matches)  "
+                  f"search {fulltext['ms']:>8.2f} ms ({fulltext['matches']:>5} matches)  x{like['ms'] / max(fulltext['ms'], 1e-6):.1f}")
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {args.output}")
+    if temporary:
+        temporary.cleanup()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Full-text index against LIKE benchmark on a synthetic dump')
+    parser.add_argument('--input', type=str, help='Folder with Posts.xml and Comments.xml; by default a synthetic dump is generated in a temporary folder')
+    parser.add_argument('--posts', type=int, default=20000, help='Number of posts of the generated dump (default is 20000)')
+    parser.add_argument('--body_size', type=int, default=1000, help='Average size of the generated post bodies (default is 1000)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the generated dump (default is 42)')
+    parser.add_argument('--batch_size', type=int, default=1000, help='Rows per batch of the inserts (default is 1000)')
+    parser.add_argument('--commit_every', type=int, default=10000, help='Rows per transaction of the inserts (default is 10000)')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs of every query; the median is reported (default is 5)')
+    parser.add_argument('--postgres_env', type=str, help='Environment file with the DB_* settings of a local Postgres to benchmark as well')
+    parser.add_argument('--output', type=str, default='search.json', help='JSON file the results are written to (default is search.json)')
+    main(parser.parse_args())
@@ -0,0 +1,195 @@
+"""
+Generator of synthetic Stack Exchange dump files (Posts.xml, Votes.xml, Comments.xml,
+Users.xml, Tags.xml and PostLinks.xml) with the attributes, value shapes and HTML
+bodies of the real dump, for benchmarks. The rows reference each other (answers point
+to questions, votes and comments to posts, posts to users and tags) and the output
+only depends on the seed. Run from the repository root:
+
+    python -m benchmarks.generate_dump --output ./inputs/synthetic --posts 100000 --body_size 1500
+"""
+import argparse
+import os
+import random
+from datetime import datetime, timedelta
+
+# Dates of the generated rows lie between these two, increasing with the Id
+FIRST_DATE = datetime(2008, 7, 31)
+LAST_DATE = datetime(2024, 3, 31)
+
+WORDS = (
+    'the a to is of and in that it for you this with on be not are can as if but or use have do what from an '
+    'when how value function error file list code data string class method object array return type using '
+    'should would could need want get set run call new like one way does work example test loop variable '
+    'python java javascript server query table database request response page window thread memory performance'
+).split()
+IDENTIFIERS = ('foo', 'bar', 'items', 'result', 'count', 'index', 'user', 'config', 'value', 'buffer', 'node', 'key')
+LICENSES = ('CC BY-SA 2.5', 'CC BY-SA 3.0', 'CC BY-SA 4.0')
+
+def escape_attribute(value):
+    """Escape a value the way the dump writes attributes (the local xml.py shadows xml.sax.saxutils)."""
+    return (value.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+            .replace('"', '&quot;').replace('\r', '&#xD;').replace('\n', '&#xA;'))
+
+def row_line(attributes):
+    """Return a `<row .../>` line; attributes that are None are left out like in the dump."""
+    return '  <row ' + ' '.join(f'{name}="{escape_attribute(str(value))}"' for name, value in attributes if value is not None) + ' />\n'
+
+def date_of(position, count, rng):
+    """A date that grows with `position` out of `count`, with some noise."""
+    span = (LAST_DATE - FIRST_DATE).total_seconds()
+    seconds = span * (position + rng.random()) / max(count, 1)
+    return (FIRST_DATE + timedelta(seconds=seconds)).isoformat(timespec='milliseconds')
+
+def sentence(rng, words=12):
+    text = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(words // 2, words * 3 // 2)))
+    return text[0].upper() + text[1:] + rng.choice('.?.')
+
+def code_block(rng):
+    lines = []
+    for _ in range(rng.randint(2, 8)):
+        name = rng.choice(IDENTIFIERS)
+        lines.append(rng.choice((
+            f'{name} = {rng.choice(IDENTIFIERS)}[{rng.randint(0, 9)}] + {rng.randint(1, 100)};',
+            f'if ({name} &lt; {rng.randint(0, 50)} &amp;&amp; {rng.choice(IDENTIFIERS)} != null) {{',
+            f'for (int i = 0; i &lt; {name}.length; i++) {{',
+            f'    print("{name}: " + {name});',
+            '}',
+        )))
+    return '<pre><code>' + '\n'.join(lines) + '\n</code></pre>'
+
+def html_body(rng, size):
+    """Return an HTML body of about `size` characters with paragraphs, inline code, links, lists and code blocks."""
+    parts = []
+    length = 0
+    target = max(20, int(size * rng.uniform(0.5, 1.5)))
+    while length < target:
+        kind = rng.random()
+        if kind < 0.55:
+            text = sentence(rng)
+            if rng.random() < 0.4:
+                text = text.replace(' ', f' <code>{rng.choice(IDENTIFIERS)}()</code> ', 1)
+            if rng.random() < 0.2:
+                text += f' See <a href="https://example.com/{rng.choice(IDENTIFIERS)}/{rng.randint(1, 99999)}" rel="nofollow noreferrer">the docs</a>.'
+            part = f'<p>{text}</p>'
+        elif kind < 0.8:
+            part = code_block(rng)
+        elif kind < 0.9:
+            part = '<ul>\n' + ''.join(f'<li>{sentence(rng, 6)}</li>\n' for _ in range(rng.randint(2, 4))) + '</ul>'
+        else:
+            part = f'<blockquote>\n  <p><strong>{sentence(rng, 4)}</strong> {sentence(rng)}</p>\n</blockquote>'
+        parts.append(part)
+        length += len(part)
+    return '\n\n'.join(parts) + '\n'
+
+def write_file(path, root, lines):
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('<?xml version="1.0" encoding="utf-8"?>\n')
+        file.write(f'<{root}>\n')
+        file.writelines(lines)
+        file.write(f'</{root}>\n')
+
+def tag_names(count):
+    """Tag names like the real ones: single words and hyphenated pairs."""
+    names = list(dict.fromkeys(WORDS))[:count]
+    for first in WORDS:
+        for second in WORDS:
+            if len(names) >= count:
+                return names
+            if first != second and f'{first}-{second}' not in names:
+                names.append(f'{first}-{second}')
+    return names
+
+def generate(output, posts=20000, comments=None, votes=None, users=None, postlinks=None, tags=500, body_size=1000, comment_size=150, seed=42):
+    """Write the six dump files to `output`; row counts that are None scale with `posts`. Returns the row count per file."""
+    rng = random.Random(seed)
+    comments = int(posts * 1.5) if comments is None else comments
+    votes = posts * 4 if votes is None else votes
+    users = max(1, posts // 4) if users is None else users
+    postlinks = posts // 10 if postlinks is None else postlinks
+    os.makedirs(output, exist_ok=True)
+    names = tag_names(tags)
+
+    def user_id():
+        return rng.randint(1, users)
+
+    write_file(os.path.join(output, 'Tags.xml'), 'tags', (row_line((
+        ('Id', i), ('TagName', name), ('Count', rng.randint(1, 300000)),
+        ('ExcerptPostId', rng.randint(1, posts) if rng.random() < 0.7 else None),
+        ('WikiPostId', rng.randint(1, posts) if rng.random() < 0.7 else None),
+    )) for i, name in enumerate(names, start=1)))
+
+    write_file(os.path.join(output, 'Users.xml'), 'users', (row_line((
+        ('Id', i), ('Reputation', int(rng.paretovariate(1.2))), ('CreationDate', date_of(i, users, rng)),
+        ('DisplayName', f'{rng.choice(IDENTIFIERS)}{rng.randint(1, 99999)}'), ('LastAccessDate', date_of(users, users, rng)),
+        ('WebsiteUrl', f'https://{rng.choice(IDENTIFIERS)}.example.com' if rng.random() < 0.2 else None),
+        ('Location', rng.choice(('Berlin, Germany', 'London, UK', 'San Francisco, CA', None, None))),
+        ('AboutMe', html_body(rng, 200) if rng.random() < 0.3 else None),
+        ('Views', rng.randint(0, 5000)), ('UpVotes', rng.randint(0, 3000)), ('DownVotes', rng.randint(0, 300)),
+        ('AccountId', i + 1000),
+    )) for i in range(1, users + 1)))
+
+    # About 40% of the posts are questions; answers point to an earlier question
+    questions = []
+
+    def post_rows():
+        for i in range(1, posts + 1):
+            created = date_of(i, posts, rng)
+            if not questions or rng.random() < 0.4:
+                questions.append(i)
+                post_tags = rng.sample(names, rng.randint(1, min(5, len(names))))
+                attributes = (
+                    ('Id', i), ('PostTypeId', 1), ('AcceptedAnswerId', i + 1 if rng.random() < 0.3 else None),
+                    ('CreationDate', created), ('Score', rng.randint(-5, 500)), ('ViewCount', rng.randint(10, 100000)),
+                    ('Body', html_body(rng, body_size)), ('OwnerUserId', user_id()),
+                    ('LastActivityDate', created), ('Title', sentence(rng, 9)),
+                    ('Tags', ''.join(f'<{name}>' for name in post_tags)),
+                    ('AnswerCount', rng.randint(0, 10)), ('CommentCount', rng.randint(0, 8)),
+                    ('ClosedDate', created if rng.random() < 0.05 else None), ('ContentLicense', rng.choice(LICENSES)),
+                )
+            else:
+                attributes = (
+                    ('Id', i), ('PostTypeId', 2), ('ParentId', rng.choice(questions[-1000:])),
+                    ('CreationDate', created), ('Score', rng.randint(-5, 300)),
+                    ('Body', html_body(rng, body_size)), ('OwnerUserId', user_id()),
+                    ('LastEditorUserId', user_id() if rng.random() < 0.3 else None),
+                    ('LastActivityDate', created), ('CommentCount', rng.randint(0, 8)),
+                    ('ContentLicense', rng.choice(LICENSES)),
+                )
+            yield row_line(attributes)
+
+    write_file(os.path.join(output, 'Posts.xml'), 'posts', post_rows())
+
+    write_file(os.path.join(output, 'Comments.xml'), 'comments', (row_line((
+        ('Id', i), ('PostId', rng.randint(1, posts)), ('Score', rng.randint(0, 20)),
+        ('Text', ' '.join(sentence(rng) for _ in range(max(1, comment_size // 60)))),
+        ('CreationDate', date_of(i, comments, rng)), ('UserId', user_id()), ('ContentLicense', rng.choice(LICENSES)),
+    )) for i in range(1, comments + 1)))
+
+    write_file(os.path.join(output, 'Votes.xml'), 'votes', (row_line((
+        ('Id', i), ('PostId', rng.randint(1, posts)), ('VoteTypeId', rng.choice((2, 2, 2, 2, 3, 1, 5))),
+        ('CreationDate', date_of(i, votes, rng)[:10] + 'T00:00:00.000'),
+    )) for i in range(1, votes + 1)))
+
+    write_file(os.path.join(output, 'PostLinks.xml'), 'postlinks', (row_line((
+        ('Id', i), ('CreationDate', date_of(i, postlinks, rng)), ('PostId', rng.randint(1, posts)),
+        ('RelatedPostId', rng.randint(1, posts)), ('LinkTypeId', rng.choice((1, 1, 3))),
+    )) for i in range(1, postlinks + 1)))
+
+    return {'Posts': posts, 'Comments': comments, 'Votes': votes, 'Users': users, 'PostLinks': postlinks, 'Tags': len(names)}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic Stack Exchange dump generator')
+    parser.add_argument('--output', type=str, default='./inputs/synthetic', help='Folder the XML files are written to (default is ./inputs/synthetic)')
+    parser.add_argument('--posts', type=int, default=20000, help='Number of posts (default is 20000); the other counts scale with it unless given')
+    parser.add_argument('--comments', type=int, help='Number of comments (default is 1.5 per post)')
+    parser.add_argument('--votes', type=int, help='Number of votes (default is 4 per post)')
+    parser.add_argument('--users', type=int, help='Number of users (default is one per 4 posts)')
+    parser.add_argument('--postlinks', type=int, help='Number of post links (default is one per 10 posts)')
+    parser.add_argument('--tags', type=int, default=500, help='Number of tags (default is 500)')
+    parser.add_argument('--body_size', type=int, default=1000, help='Average size of a post body in characters of HTML (default is 1000)')
+    parser.add_argument('--comment_size', type=int, default=150, help='Average size of a comment in characters (default is 150)')
+    parser.add_argument('--seed', type=int, default=42, help='Seed of the random generator (default is 42)')
+    args = parser.parse_args()
+    counts = generate(args.output, args.posts, args.comments, args.votes, args.users, args.postlinks, args.tags, args.body_size, args.comment_size, args.seed)
+    for name, count in counts.items():
+        print(f"{os.path.join(args.output, name + '.xml')}: {count} rows")
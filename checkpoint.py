@@ -0,0 +1,53 @@
+import json
+import os
+
+def checkpoint_path(path, shard=None):
+    """Return the checkpoint file of a dump file, or of one `(index, count)` shard of it."""
+    if shard:
+        index, count = shard
+        return f"{path}.shard{index}of{count}.checkpoint"
+    return path + '.checkpoint'
+
+def read_checkpoint(path, shard=None):
+    """Return the last checkpoint written for a dump file (or shard), or None."""
+    try:
+        with open(checkpoint_path(path, shard), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+def file_identity(path):
+    """Return the size and modification time of a dump file, which a checkpoint is only valid for."""
+    stat = os.stat(path)
+    return {'file_size': stat.st_size, 'file_mtime_ns': stat.st_mtime_ns}
+
+def checkpoint_is_stale(path, checkpoint):
+    """
+    Return True when the dump file was replaced or changed since the checkpoint was written,
+    so its byte offset no longer points to the same line. Checkpoints written before the
+    size and modification time were recorded are taken as they are.
+    """
+    identity = file_identity(path)
+    return any(key in checkpoint and checkpoint[key] != value for key, value in identity.items())
+
+def write_checkpoint(path, byte_offset, line_number, last_id, completed=False, shard=None):
+    """
+    Record where an import of a dump file can resume: the byte offset and number of
+    the next line to read and the Id of the last row written before it, along with
+    the size and modification time of the file (see `checkpoint_is_stale`).
+    Only call it after the rows up to that point are committed.
+    """
+    checkpoint = {
+        'byte_offset': byte_offset,
+        'line_number': line_number,
+        'last_id': last_id,
+        'completed': completed,
+        **file_identity(path),
+    }
+    target = checkpoint_path(path, shard)
+    # Write to a temporary file first so a crash never leaves a truncated checkpoint behind
+    with open(target + '.tmp', 'w', encoding='utf-8') as file:
+        json.dump(checkpoint, file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(target + '.tmp', target)
@@ -1,20 +1,64 @@
 import os
-import sqlite3
-import psycopg2
-
-DBMS = os.getenv('DBMS')
-print(f"DBMS: {DBMS}")
-if DBMS == 'SQLITE':
-    PLACE_HOLDER = "?"
-elif DBMS == 'POSTGRES':
-    PLACE_HOLDER = "%s"
-else:
-    raise ValueError("Unsupported DBMS")
-
-def open_connection():
-    if DBMS == 'SQLITE':
-        conn = sqlite3.connect(os.getenv('DB_PATH'))
-    elif DBMS == 'POSTGRES':
+import io
+import time
+from datetime import datetime
+from schema import TABLES, ADDITIVE_TABLES, FULLTEXT_COLUMNS, column_names, column_types, column_index, primary_key
+from rowparser import tag_names
+
+# The database drivers (sqlite3, psycopg2, duckdb, pyarrow) are imported when they are first
+# used and DBMS is read on first use, so importing this module stays cheap for every shard job
+SUPPORTED_DBMS = ('SQLITE', 'POSTGRES', 'DUCKDB', 'PARQUET')
+PLACE_HOLDERS = {'SQLITE': '?', 'POSTGRES': '%s', 'DUCKDB': '?', 'PARQUET': None}
+
+_dbms = None
+
+def get_dbms():
+    """Return the DBMS setting of the environment, checked once."""
+    global _dbms
+    if _dbms is None:
+        dbms = os.getenv('DBMS')
+        print(f"DBMS: {dbms}")
+        if dbms not in SUPPORTED_DBMS:
+            raise ValueError("Unsupported DBMS")
+        _dbms = dbms
+    return _dbms
+
+def get_place_holder():
+    """Return the query parameter marker of the DBMS (Parquet output has no SQL)."""
+    return PLACE_HOLDERS[get_dbms()]
+
+def get_cursor(conn):
+    # A DuckDB cursor is a second connection with its own transaction, so statements run on the connection itself
+    if get_dbms() == 'DUCKDB':
+        return conn
+    return conn.cursor()
+
+# Settings of a SQLITE bulk load (see `configure_bulk_load`)
+SQLITE_BULK_PRAGMAS = (
+    "PRAGMA synchronous = OFF",
+    "PRAGMA cache_size = -1048576",  # 1 GiB
+    "PRAGMA mmap_size = 2147418112",
+    "PRAGMA temp_store = MEMORY",
+)
+# Page size of SQLITE databases created by a bulk load; it only applies to a new, empty file
+SQLITE_BULK_PAGE_SIZE = 32768
+
+def open_connection(bulk=False, journal_mode='WAL'):
+    if get_dbms() == 'SQLITE':
+        import sqlite3
+        # Store dates the way the dump writes them, e.g. 2008-07-31T21:42:52.667
+        sqlite3.register_adapter(datetime, lambda value: value.isoformat(timespec='milliseconds'))
+        # Wait for the lock instead of failing when several shards write to the same file
+        conn = sqlite3.connect(os.getenv('DB_PATH'), timeout=300)
+        if bulk:
+            configure_bulk_load(conn, journal_mode)
+    elif get_dbms() == 'PARQUET':
+        conn = ParquetSink(os.getenv('PARQUET_PATH', './db/parquet'))
+    elif get_dbms() == 'DUCKDB':
+        import duckdb
+        conn = duckdb.connect(os.getenv('DB_PATH'))
+    elif get_dbms() == 'POSTGRES':
+        import psycopg2
         conn = psycopg2.connect(
             dbname=os.getenv('DB_NAME'),
             user=os.getenv('DB_USER'),
@@ -27,256 +71,906 @@ def open_connection():
 
     return conn
 
+def is_transient_error(error):
+    """
+    Whether an error of the database may not happen again on a new connection: a lost
+    connection, a server that is restarting or a database locked by another writer.
+    """
+    if get_dbms() == 'POSTGRES':
+        import psycopg2
+        return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+    if get_dbms() == 'SQLITE':
+        import sqlite3
+        return isinstance(error, sqlite3.OperationalError) and any(text in str(error) for text in ('locked', 'busy', 'disk I/O'))
+    if get_dbms() == 'DUCKDB':
+        import duckdb
+        return isinstance(error, (duckdb.IOException, duckdb.ConnectionException))
+    return False
+
+def connection_alive(conn):
+    """Whether a connection still answers, e.g. after an import that lost it and went on over a new one."""
+    if get_dbms() == 'PARQUET':
+        return True
+    try:
+        get_cursor(conn).execute("SELECT 1")
+        if get_dbms() != 'DUCKDB':
+            # DuckDB runs the statement in autocommit; the others leave nothing open
+            conn.rollback()
+        return True
+    except Exception:
+        return False
+
+def configure_bulk_load(conn, journal_mode='WAL'):
+    """
+    Trade durability for speed while a SQLITE database is bulk loaded: no fsync, a large
+    page cache, memory mapped reads and in-memory temporary tables. With `journal_mode`
+    WAL a crash of the importer leaves the database intact but a crash of the machine may
+    lose the last commits; with OFF a crash in the middle of a transaction can corrupt it.
+    """
+    cursor = get_cursor(conn)
+    cursor.execute(f"PRAGMA page_size = {SQLITE_BULK_PAGE_SIZE}")
+    cursor.execute(f"PRAGMA journal_mode = {journal_mode}")
+    for pragma in SQLITE_BULK_PRAGMAS:
+        cursor.execute(pragma)
+
+def finish_bulk_load(conn):
+    """Restore the safe settings after a bulk load and refresh the query planner statistics."""
+    if get_dbms() == 'PARQUET':
+        return
+    cursor = get_cursor(conn)
+    conn.commit()
+    if get_dbms() == 'SQLITE':
+        cursor.execute("PRAGMA journal_mode = DELETE")
+        cursor.execute("PRAGMA synchronous = FULL")
+    cursor.execute("ANALYZE")
+    if get_dbms() == 'DUCKDB':
+        # Write the whole load from the write-ahead log into the database file
+        cursor.execute("CHECKPOINT")
+    conn.commit()
+
 def close_connection(conn):
     conn.commit()
     # Close the database connection
     conn.close()
     
+# SQL type of every column type of `schema.TABLES`. SQLITE has no date type; ISO 8601 text
+# (the format of the dump) sorts and compares in date order.
+SQL_TYPES = {
+    'SQLITE': {'int': 'INTEGER', 'bigint': 'INTEGER', 'bool': 'BOOLEAN', 'datetime': 'TEXT', 'text': 'TEXT', 'bytes': 'BLOB'},
+    'POSTGRES': {'int': 'INTEGER', 'bigint': 'BIGINT', 'bool': 'BOOLEAN', 'datetime': 'TIMESTAMP', 'text': 'TEXT', 'bytes': 'BYTEA'},
+    'DUCKDB': {'int': 'INTEGER', 'bigint': 'BIGINT', 'bool': 'BOOLEAN', 'datetime': 'TIMESTAMP', 'text': 'TEXT', 'bytes': 'BLOB'},
+}
+
+def existing_columns(conn, table):
+    """Return the lower-case names of the columns a table already has (empty if it does not exist)."""
+    cursor = get_cursor(conn)
+    if get_dbms() == 'SQLITE':
+        cursor.execute(f"PRAGMA table_info({table})")
+        return {row[1].lower() for row in cursor.fetchall()}
+    cursor.execute(f"SELECT column_name FROM information_schema.columns WHERE table_schema = current_schema() AND table_name = {get_place_holder()}", (table,))
+    return {row[0].lower() for row in cursor.fetchall()}
+
 def create_tables(conn):
-    cursor = conn.cursor()
-    # Create the tags table
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS posts (
-        Id INTEGER PRIMARY KEY,
-        PostTypeId INTEGER,
-        AcceptedAnswerId INTEGER,
-        CreationDate TEXT,
-        Score INTEGER,
-        ViewCount INTEGER,
-        Body TEXT,
-        OwnerUserId INTEGER,
-        LastEditorUserId INTEGER,
-        LastEditorDisplayName TEXT,
-        LastEditDate TEXT,
-        LastActivityDate TEXT,
-        Title TEXT,
-        Tags TEXT,
-        AnswerCount INTEGER,
-        CommentCount INTEGER,
-        FavoriteCount INTEGER,
-        CommunityOwnedDate TEXT,
-        ContentLicense TEXT,
-        Error BOOLEAN
-    )
-    ''')  
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS comments (
-        Id INTEGER PRIMARY KEY,
-        PostId INTEGER,
-        Score INTEGER,
-        Text TEXT,
-        CreationDate TEXT,
-        UserId INTEGER,
-        ContentLicense TEXT,
-        Error BOOLEAN
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS postlinks (
-        Id INTEGER PRIMARY KEY,
-        CreationDate TEXT,
-        PostId INTEGER,
-        RelatedPostId INTEGER,
-        LinkTypeId INTEGER
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS tags (
-        Id INTEGER PRIMARY KEY,
-        TagName TEXT,
-        Count INTEGER,
-        ExcerptPostId INTEGER,
-        WikiPostId INTEGER
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS users (
-        Id INTEGER PRIMARY KEY,
-        Reputation INTEGER,
-        CreationDate TEXT,
-        DisplayName TEXT,
-        LastAccessDate TEXT,
-        AboutMe TEXT,
-        Views INTEGER,
-        UpVotes INTEGER,
-        DownVotes INTEGER,
-        Error BOOLEAN
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS votes (
-        Id INTEGER PRIMARY KEY,
-        PostId INTEGER,
-        VoteTypeId INTEGER,
-        CreationDate TEXT
-    )
+    """Create the tables of `schema.TABLES`, adding the columns that tables of older imports do not have yet."""
+    if get_dbms() == 'PARQUET':
+        # The directory of a table is created with its first file
+        return
+    cursor = get_cursor(conn)
+    if get_dbms() == 'POSTGRES':
+        # Parallel imports may create the tables at the same time; IF NOT EXISTS alone does not serialize them
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('create_tables'))")
+    sql_types = SQL_TYPES[get_dbms()]
+
+    for table in TABLES:
+        columns = column_types(table)
+        key = primary_key(table)
+        definitions = [
+            f"{name} {sql_types[column_type]}{' PRIMARY KEY' if key == (name,) else ''}"
+            for name, column_type in columns
+        ]
+        options = ''
+        if len(key) > 1:
+            definitions.append(f"PRIMARY KEY ({', '.join(key)})")
+            if get_dbms() == 'SQLITE':
+                # Store the rows in the primary key b-tree itself instead of next to it
+                options = ' WITHOUT ROWID'
+        definitions = ',\n        '.join(definitions)
+        cursor.execute(f'''
+    CREATE TABLE IF NOT EXISTS {table} (
+        {definitions}
+    ){options}
     ''')
-    
+        present = existing_columns(conn, table)
+        for name, column_type in columns:
+            if name.lower() not in present:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {sql_types[column_type]}")
+
     conn.commit() 
-    
-def insert_post_data(conn, data):
-    cursor = conn.cursor()
-    # Prepare data tuple
-    post_data = (
-        data.get('Id', None), data.get('PostTypeId', None), data.get('AcceptedAnswerId', None), 
-        data.get('CreationDate', None), data.get('Score', None), data.get('ViewCount', None), 
-        data.get('Body', None), data.get('OwnerUserId', None), data.get('LastEditorUserId', None), 
-        data.get('LastEditorDisplayName', None), data.get('LastEditDate', None), 
-        data.get('LastActivityDate', None), data.get('Title', None), 
-        data.get('Tags', None), data.get('AnswerCount', None), data.get('CommentCount', None), 
-        data.get('FavoriteCount', None), data.get('CommunityOwnedDate', None), 
-        data.get('ContentLicense', None), data.get('Error', None)
-    )
-    
-    # Insert into database with ON CONFLICT clause
-    sql = f'''INSERT INTO posts (Id, PostTypeId, AcceptedAnswerId, CreationDate, Score, ViewCount, Body, OwnerUserId, LastEditorUserId, LastEditorDisplayName, LastEditDate, LastActivityDate, Title, Tags, AnswerCount, CommentCount, FavoriteCount, CommunityOwnedDate, ContentLicense, Error)
-              VALUES ({PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER})
-              ON CONFLICT(Id) DO UPDATE SET
-                PostTypeId = EXCLUDED.PostTypeId,
-                AcceptedAnswerId = EXCLUDED.AcceptedAnswerId,
-                CreationDate = EXCLUDED.CreationDate,
-                Score = EXCLUDED.Score,
-                ViewCount = EXCLUDED.ViewCount,
-                Body = EXCLUDED.Body,
-                OwnerUserId = EXCLUDED.OwnerUserId,
-                LastEditorUserId = EXCLUDED.LastEditorUserId,
-                LastEditorDisplayName = EXCLUDED.LastEditorDisplayName,
-                LastEditDate = EXCLUDED.LastEditDate,
-                LastActivityDate = EXCLUDED.LastActivityDate,
-                Title = EXCLUDED.Title,
-                Tags = EXCLUDED.Tags,
-                AnswerCount = EXCLUDED.AnswerCount,
-                CommentCount = EXCLUDED.CommentCount,
-                FavoriteCount = EXCLUDED.FavoriteCount,
-                CommunityOwnedDate = EXCLUDED.CommunityOwnedDate,
-                ContentLicense = EXCLUDED.ContentLicense,
-                Error = EXCLUDED.Error
-           '''
-    cursor.execute(sql, post_data)
+
+# Secondary indexes on the common join keys: (name, table, columns). They are only
+# built by `build_indexes` once the bulk load is done, so inserts do not maintain them.
+SECONDARY_INDEXES = (
+    ('idx_posts_owner_user_id', 'posts', 'OwnerUserId'),
+    ('idx_comments_post_id', 'comments', 'PostId'),
+    ('idx_votes_post_id', 'votes', 'PostId'),
+    ('idx_postlinks_post_id', 'postlinks', 'PostId'),
+    ('idx_postlinks_related_post_id', 'postlinks', 'RelatedPostId'),
+    ('idx_post_tags_tag_id', 'post_tags', 'TagId, PostId'),
+    ('idx_post_history_post_id', 'post_history', 'PostId'),
+    ('idx_badges_user_id', 'badges', 'UserId'),
+)
+
+def index_exists(conn, name):
+    cursor = get_cursor(conn)
+    if get_dbms() == 'SQLITE':
+        cursor.execute(f"SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = {get_place_holder()}", (name,))
+    elif get_dbms() == 'DUCKDB':
+        cursor.execute(f"SELECT 1 FROM duckdb_indexes() WHERE index_name = {get_place_holder()}", (name,))
+    else:
+        cursor.execute(f"SELECT 1 FROM pg_indexes WHERE indexname = {get_place_holder()}", (name,))
+    return cursor.fetchone() is not None
+
+def build_indexes(conn, parallel_workers=4):
+    """
+    Create the secondary indexes that do not exist yet and return a list of
+    (index name, seconds it took or None if it already existed).
+    POSTGRES sorts with parallel maintenance workers; SQLITE with a large cache and sorter threads;
+    DUCKDB with `parallel_workers` threads. Parquet files have no indexes.
+    """
+    if get_dbms() == 'PARQUET':
+        return []
+    cursor = get_cursor(conn)
+    if get_dbms() == 'POSTGRES':
+        cursor.execute(f"SET max_parallel_maintenance_workers = {int(parallel_workers)}")
+        cursor.execute("SET maintenance_work_mem = '1GB'")
+    elif get_dbms() == 'DUCKDB':
+        cursor.execute(f"SET threads = {int(parallel_workers)}")
+    else:
+        cursor.execute("PRAGMA cache_size = -1048576")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        cursor.execute(f"PRAGMA threads = {int(parallel_workers)}")
+
+    results = []
+    for name, table, columns in SECONDARY_INDEXES:
+        if index_exists(conn, name):
+            results.append((name, None))
+            continue
+        started_at = time.perf_counter()
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+        conn.commit()
+        results.append((name, time.perf_counter() - started_at))
+    return results + build_fulltext_indexes(conn)
+
+def fulltext_sql(table):
+    """Return the POSTGRES expression of the `SearchVector` of a table, the first column weighted highest."""
+    parts = [
+        f"setweight(to_tsvector('english', coalesce({name}, '')), '{weight}')"
+        for name, weight in zip(FULLTEXT_COLUMNS[table], 'ABCD')
+    ]
+    return ' || '.join(parts)
+
+def create_fulltext(conn):
+    """
+    Add full-text search to the tables of `schema.FULLTEXT_COLUMNS`. SQLITE gets an FTS5
+    external-content table `<table>_fts` (it indexes the text without storing a copy),
+    filled from the rows already there and then kept up to date by the writers.
+    POSTGRES gets a stored generated `SearchVector` tsvector column; its GIN index is built
+    by `build_fulltext_indexes` once the load is done.
+    """
+    if get_dbms() not in ('SQLITE', 'POSTGRES'):
+        raise ValueError(f"Full-text search is only supported on SQLITE and POSTGRES, not DBMS={get_dbms()}")
+    cursor = get_cursor(conn)
+    if get_dbms() == 'POSTGRES':
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('create_tables'))")
+        for table in FULLTEXT_COLUMNS:
+            if 'searchvector' not in existing_columns(conn, table):
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN SearchVector tsvector GENERATED ALWAYS AS ({fulltext_sql(table)}) STORED")
+    else:
+        existing = fulltext_tables(conn)
+        for table, columns in FULLTEXT_COLUMNS.items():
+            if table in existing:
+                continue
+            cursor.execute(f'''
+    CREATE VIRTUAL TABLE IF NOT EXISTS {table}_fts USING fts5(
+        {', '.join(columns)}, content='{table}', content_rowid='Id', tokenize='porter unicode61'
+    )''')
+            cursor.execute(f"INSERT INTO {table}_fts({table}_fts) VALUES ('rebuild')")
     conn.commit()
 
-def insert_comment_data(conn, data):
-    cursor = conn.cursor()
-    # Prepare data tuple
-    comment_data = (
-        data.get('Id', 0), data.get('PostId', 0), data.get('Score', 0),
-        data.get('Text', None), data.get('CreationDate', None),
-        data.get('UserId', 0), data.get('ContentLicense', None), 
-        data.get('Error', None)
-    )
-
-    # Insert into database with ON CONFLICT clause
-    sql = f'''
-    INSERT INTO comments (Id, PostId, Score, Text, CreationDate, UserId, ContentLicense, Error)
-    VALUES ({PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER})
-    ON CONFLICT(Id) DO UPDATE SET
-        PostId = EXCLUDED.PostId,
-        Score = EXCLUDED.Score,
-        Text = EXCLUDED.Text,
-        CreationDate = EXCLUDED.CreationDate,
-        UserId = EXCLUDED.UserId,
-        ContentLicense = EXCLUDED.ContentLicense,
-        Error = EXCLUDED.Error
+def fulltext_tables(conn):
+    """Return the tables with a SQLITE FTS5 index that the writers keep up to date (none on other DBMS)."""
+    if get_dbms() != 'SQLITE':
+        return set()
+    cursor = get_cursor(conn)
+    names = [f"{table}_fts" for table in FULLTEXT_COLUMNS]
+    cursor.execute(f"SELECT name FROM sqlite_master WHERE type = 'table' AND name IN ({', '.join('?' * len(names))})", names)
+    return {row[0][:-len('_fts')] for row in cursor.fetchall()}
+
+def build_fulltext_indexes(conn):
+    """
+    Create the POSTGRES GIN indexes on the `SearchVector` columns added by `create_fulltext`
+    and return a list of (index name, seconds it took or None if it already existed).
+    """
+    if get_dbms() != 'POSTGRES':
+        return []
+    cursor = get_cursor(conn)
+    results = []
+    for table in FULLTEXT_COLUMNS:
+        if 'searchvector' not in existing_columns(conn, table):
+            continue
+        name = f"idx_{table}_search"
+        if index_exists(conn, name):
+            results.append((name, None))
+            continue
+        started_at = time.perf_counter()
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('build_fulltext_indexes'))")
+        cursor.execute("SET maintenance_work_mem = '1GB'")
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} USING GIN (SearchVector)")
+        conn.commit()
+        results.append((name, time.perf_counter() - started_at))
+    return results
+
+def write_fulltext(conn, table, rows, write):
+    """
+    Write rows with `write(table, rows)` and update the SQLITE FTS5 index of the table in
+    the same transaction. An external-content index can only remove the terms of a row it
+    is given again, so the stored texts of the rows being replaced are deleted first; the
+    new terms are read back from the table, which keeps texts left out by --columns.
+    """
+    cursor = get_cursor(conn)
+    column_list = ', '.join(FULLTEXT_COLUMNS[table])
+    cursor.executemany(f'''
+    INSERT INTO {table}_fts({table}_fts, rowid, {column_list})
+    SELECT 'delete', Id, {column_list} FROM {table} WHERE Id = ?
+    ''', [(row[0],) for row in rows])
+    write(table, rows)
+    cursor.executemany(f'''
+    INSERT INTO {table}_fts(rowid, {column_list})
+    SELECT Id, {column_list} FROM {table} WHERE Id = ?
+    ''', [(row[0],) for row in unique_rows(table, rows)])
+
+def on_conflict_sql(table, columns=None):
+    """
+    Return the `ON CONFLICT` clause that makes an insert into a table an upsert. With
+    `columns` (see `filters.projected_columns`) only those are updated on a stored row.
+    """
+    key = primary_key(table)
+    updated = [name for name in column_names(table) if name not in key and (columns is None or name in columns)]
+    if table in ADDITIVE_TABLES:
+        updates = ',\n        '.join(f"{name} = {table}.{name} + EXCLUDED.{name}" for name in updated)
+    else:
+        updates = ',\n        '.join(f"{name} = EXCLUDED.{name}" for name in updated)
+    if not updates:
+        return f"ON CONFLICT({', '.join(key)}) DO NOTHING"
+    return f"ON CONFLICT({', '.join(key)}) DO UPDATE SET\n        {updates}"
+
+# Upsert statements per table and updated columns, built on first use
+_UPSERT_SQL = {}
+
+def upsert_sql(table, columns=None):
+    """Return the `INSERT ... ON CONFLICT` statement of a table, building it only once."""
+    sql = _UPSERT_SQL.get((table, columns))
+    if sql is None:
+        names = column_names(table)
+        placeholders = ', '.join([get_place_holder()] * len(names))
+        sql = f'''
+    INSERT INTO {table} ({', '.join(names)})
+    VALUES ({placeholders})
+    {on_conflict_sql(table, columns)}
     '''
-    cursor.execute(sql, comment_data)
+        _UPSERT_SQL[(table, columns)] = sql
+    return sql
+
+def insert_rows(conn, table, rows, columns=None):
+    """
+    Upsert a list of row tuples into a table with a single round of `executemany`; with
+    `columns` only those are updated on the rows that are already stored.
+    """
+    cursor = get_cursor(conn)
+    sql = upsert_sql(table, columns)
+    if get_dbms() == 'POSTGRES':
+        from psycopg2.extras import execute_batch
+        # psycopg2's executemany runs one statement per row; execute_batch sends them in pages
+        execute_batch(cursor, sql, rows, page_size=len(rows))
+    else:
+        cursor.executemany(sql, rows)
+
+def delete_post_tags(conn, post_ids):
+    """Delete the tags, known and pending, of the given posts."""
+    if get_dbms() == 'PARQUET':
+        # Parquet files are only appended to
+        return
+    cursor = get_cursor(conn)
+    for table in ('post_tags', 'post_tags_pending'):
+        if get_dbms() == 'POSTGRES':
+            cursor.execute(f"DELETE FROM {table} WHERE PostId = ANY(%s)", (list(post_ids),))
+        elif get_dbms() == 'DUCKDB':
+            cursor.execute(f"DELETE FROM {table} WHERE PostId IN (SELECT UNNEST(?))", (list(post_ids),))
+        else:
+            cursor.executemany(f"DELETE FROM {table} WHERE PostId = ?", [(post_id,) for post_id in post_ids])
+
+def resolve_pending_tags(conn):
+    """
+    Move the pending tags whose name is now in the tags table to post_tags.
+    Returns the number of post tags that are still pending, or None for Parquet output
+    where post_tags_pending is kept as written and joined with tags when reading.
+    """
+    if get_dbms() == 'PARQUET':
+        return None
+    cursor = get_cursor(conn)
+    # WHERE TRUE keeps SQLITE from reading ON CONFLICT as the constraint of the join
+    cursor.execute('''
+    INSERT INTO post_tags (PostId, TagId)
+    SELECT pending.PostId, tags.Id
+    FROM post_tags_pending pending JOIN tags ON tags.TagName = pending.TagName
+    WHERE TRUE
+    ON CONFLICT(PostId, TagId) DO NOTHING
+    ''')
+    cursor.execute("DELETE FROM post_tags_pending WHERE TagName IN (SELECT TagName FROM tags)")
+    cursor.execute("SELECT COUNT(*) FROM post_tags_pending")
+    remaining = cursor.fetchone()[0]
     conn.commit()
+    return remaining
 
-def insert_postlink_data(conn, data):
-    cursor = conn.cursor()
-    # Prepare data tuple
-    postlink_data = (
-        data.get('Id', 0), data.get('CreationDate', None),
-        data.get('PostId', 0), data.get('RelatedPostId', 0),
-        data.get('LinkTypeId', 0)
-    )
-
-    # Insert into database with ON CONFLICT clause
-    sql = f'''
-    INSERT INTO postlinks (Id, CreationDate, PostId, RelatedPostId, LinkTypeId)
-    VALUES ({PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER})
-    ON CONFLICT(Id) DO UPDATE SET
-        CreationDate = EXCLUDED.CreationDate,
-        PostId = EXCLUDED.PostId,
-        RelatedPostId = EXCLUDED.RelatedPostId,
-        LinkTypeId = EXCLUDED.LinkTypeId
-    '''
-    cursor.execute(sql, postlink_data)
+def read_row_hashes(conn, table, first_id, last_id):
+    """Return the stored content hashes of the rows of a table with an Id in the given range, by Id."""
+    cursor = get_cursor(conn)
+    place_holder = get_place_holder()
+    cursor.execute(f"SELECT Id, Hash FROM row_hashes WHERE TableName = {place_holder} AND Id BETWEEN {place_holder} AND {place_holder}", (table, first_id, last_id))
+    return dict(cursor.fetchall())
+
+def read_watermark(conn, table):
+    """Return the LastActivityDate watermark of a table recorded by the last delta import, or None."""
+    cursor = get_cursor(conn)
+    cursor.execute(f"SELECT Watermark FROM delta_watermarks WHERE TableName = {get_place_holder()}", (table,))
+    row = cursor.fetchone()
+    if row is None or row[0] is None:
+        return None
+    # SQLITE returns the ISO 8601 text
+    return datetime.fromisoformat(row[0]) if isinstance(row[0], str) else row[0]
+
+def update_watermark(conn, table, watermark):
+    """Record the watermark of a table, keeping the later one when shards record theirs."""
+    cursor = get_cursor(conn)
+    place_holder = get_place_holder()
+    cursor.execute(f'''
+    INSERT INTO delta_watermarks (TableName, Watermark) VALUES ({place_holder}, {place_holder})
+    ON CONFLICT(TableName) DO UPDATE SET Watermark = EXCLUDED.Watermark
+    WHERE EXCLUDED.Watermark > delta_watermarks.Watermark OR delta_watermarks.Watermark IS NULL
+    ''', (table, watermark))
     conn.commit()
 
-def insert_tag_data(conn, data):
-    cursor = conn.cursor()
-    # Prepare data tuple
-    tag_data = (
-        data.get('Id', 0), data.get('TagName', None),
-        data.get('Count', 0), data.get('ExcerptPostId', 0),
-        data.get('WikiPostId', 0)
-    )
-
-    # Insert into database with ON CONFLICT clause
-    sql = f'''
-    INSERT INTO tags (Id, TagName, Count, ExcerptPostId, WikiPostId)
-    VALUES ({PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER})
-    ON CONFLICT(Id) DO UPDATE SET
-        TagName = EXCLUDED.TagName,
-        Count = EXCLUDED.Count,
-        ExcerptPostId = EXCLUDED.ExcerptPostId,
-        WikiPostId = EXCLUDED.WikiPostId
-    '''
-    cursor.execute(sql, tag_data)
+def reset_stats(conn, table, source, shard=None):
+    """
+    Delete the counters a fresh import of `source` is about to count again: those of its
+    shard, and of the shards beyond the shard count (all of them for an import without shards).
+    """
+    if get_dbms() == 'PARQUET':
+        # Parquet files are only appended to
+        return
+    index, count = shard or (0, 1)
+    cursor = get_cursor(conn)
+    place_holder = get_place_holder()
+    cursor.execute(f"DELETE FROM {table} WHERE Shard = {place_holder} OR Shard >= {place_holder}", (index, count))
+    cursor.execute(f"DELETE FROM stats_offsets WHERE TableName = {place_holder} AND (Shard = {place_holder} OR Shard >= {place_holder})", (source, index, count))
     conn.commit()
 
-def insert_user_data(conn, data):
-    cursor = conn.cursor()
-    # Prepare data tuple, converting special HTML entities and newline characters in 'AboutMe'
-    user_data = (
-        data.get('Id', 0), data.get('Reputation', 0), 
-        data.get('CreationDate', None), data.get('DisplayName', None), 
-        data.get('LastAccessDate', None), 
-        data.get('AboutMe', None), 
-        data.get('Views', 0), data.get('UpVotes', 0), 
-        data.get('DownVotes', 0), data.get('Error', None)
-    )
-
-    # Insert into database with ON CONFLICT clause
-    sql = f'''
-    INSERT INTO users (Id, Reputation, CreationDate, DisplayName, LastAccessDate, AboutMe, Views, UpVotes, DownVotes, Error)
-    VALUES ({PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER})
-    ON CONFLICT(Id) DO UPDATE SET
-        Reputation = EXCLUDED.Reputation,
-        CreationDate = EXCLUDED.CreationDate,
-        DisplayName = EXCLUDED.DisplayName,
-        LastAccessDate = EXCLUDED.LastAccessDate,
-        AboutMe = EXCLUDED.AboutMe,
-        Views = EXCLUDED.Views,
-        UpVotes = EXCLUDED.UpVotes,
-        DownVotes = EXCLUDED.DownVotes,
-        Error = EXCLUDED.Error
-    '''
-    cursor.execute(sql, user_data)
+def write_stats_offset(conn, source, shard_index, byte_offset):
+    """Record the byte offset from which the rows of a table (and shard) are counted, e.g. where an import past the first line starts."""
+    if get_dbms() == 'PARQUET':
+        # Parquet files are only appended to; the largest recorded offset is the one read back
+        return
+    insert_rows(conn, 'stats_offsets', [(source, shard_index, byte_offset)])
     conn.commit()
 
-def insert_vote_data(conn, data):
-    cursor = conn.cursor()
-    # Prepare data tuple
-    vote_data = (
-        data.get('Id', None), data.get('PostId', 0), 
-        data.get('VoteTypeId', 0), data.get('CreationDate', None)
-    )
-
-    # Insert into database with ON CONFLICT clause
-    sql = f'''
-    INSERT INTO votes (Id, PostId, VoteTypeId, CreationDate)
-    VALUES ({PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER}, {PLACE_HOLDER})
-    ON CONFLICT(Id) DO UPDATE SET
-        PostId = EXCLUDED.PostId,
-        VoteTypeId = EXCLUDED.VoteTypeId,
-        CreationDate = EXCLUDED.CreationDate
-    '''
-    cursor.execute(sql, vote_data)
+def read_stats_offset(conn, source, shard_index):
+    """Return the byte offset up to which the rows of a table (and shard) are counted in its stats table, or 0."""
+    if get_dbms() == 'PARQUET':
+        offsets = [offset for name, index, offset in zip(*conn.read_columns('stats_offsets', ('TableName', 'Shard', 'ByteOffset')))
+                   if name == source and index == shard_index]
+        return max(offsets, default=0)
+    cursor = get_cursor(conn)
+    place_holder = get_place_holder()
+    cursor.execute(f"SELECT ByteOffset FROM stats_offsets WHERE TableName = {place_holder} AND Shard = {place_holder}", (source, shard_index))
+    row = cursor.fetchone()
+    return row[0] if row else 0
+
+def merge_stats(conn, table):
+    """Add the counters of the shards of an import into shard 0, so there is one row per post."""
+    if get_dbms() == 'PARQUET':
+        return
+    counters = [name for name in column_names(table) if name not in primary_key(table)]
+    cursor = get_cursor(conn)
+    cursor.execute(f'''
+    INSERT INTO {table} (PostId, Shard, {', '.join(counters)})
+    SELECT PostId, 0, {', '.join(f"SUM({name})" for name in counters)}
+    FROM {table} WHERE Shard > 0 GROUP BY PostId
+    {on_conflict_sql(table)}
+    ''')
+    cursor.execute(f"DELETE FROM {table} WHERE Shard > 0")
     conn.commit()
+
+class TagIds:
+    """
+    Interns tag names to the Ids of the tags table, loaded once into a dictionary.
+    Tags that are not in the table yet (Tags imported after Posts) are written to
+    post_tags_pending by name; `resolve_pending_tags` moves them over later.
+    """
+
+    def __init__(self, conn):
+        if get_dbms() == 'PARQUET':
+            self.ids = dict(zip(*conn.read_columns('tags', ('TagName', 'Id'))))
+            return
+        cursor = get_cursor(conn)
+        cursor.execute("SELECT TagName, Id FROM tags")
+        self.ids = dict(cursor.fetchall())
+
+    def post_tag_rows(self, post_id, tags):
+        """Return the (table, row) pairs of the tags of a post, given its `Tags`."""
+        rows = []
+        for name in set(tag_names(tags)):
+            tag_id = self.ids.get(name)
+            if tag_id is None:
+                rows.append(('post_tags_pending', (post_id, name)))
+            else:
+                rows.append(('post_tags', (post_id, tag_id)))
+        return rows
+
+class WriteError(Exception):
+    """A batch of rows the database rejected, with its table and the error of the database."""
+
+    def __init__(self, table, rows, error):
+        super().__init__(f"{type(error).__name__} writing {table}: {error}")
+        self.table = table
+        self.rows = rows
+        self.error = error
+
+class BatchWriter:
+    """
+    Buffers rows per table and writes them in batches.
+    Rows are flushed with one `executemany` every `batch_size` rows and the
+    transaction is committed every `commit_every` rows, instead of once per row.
+    """
+
+    def __init__(self, conn, batch_size=1000, commit_every=10000, on_commit=None):
+        self.conn = conn
+        # Called after every commit, e.g. to record a checkpoint of what is now durable
+        self.on_commit = on_commit
+        # Called before every commit once the other rows are written, e.g. to add rows that must be committed with them
+        self.before_commit = None
+        # Whether `add` commits by itself; off when the caller can only checkpoint whole chunks, see `commit_due`
+        self.autocommit = True
+        self.batch_size = max(1, batch_size)
+        self.commit_every = max(self.batch_size, commit_every)
+        self.buffers = {}
+        self.pending = 0
+        self.uncommitted = 0
+        # Rows per table written since the last commit, and committed
+        self.uncommitted_rows = {}
+        self.committed_rows = {}
+        # An `ImportMetrics` that records the insert and commit times, if set
+        self.metrics = None
+        # Tables whose FTS5 index is written together with them (see `create_fulltext`)
+        self.fulltext = fulltext_tables(conn)
+        # The columns a table is filled with, by table (see `filters.projected_columns`); the
+        # other columns of a stored row keep their values
+        self.projections = {}
+
+    def add(self, table, row, related=()):
+        """
+        Queue a row tuple (in the column order of `schema.TABLES`) for the given table.
+        `related` (table, row) pairs, e.g. the tags of a post, are queued with it so they
+        are always written in the same batch.
+        """
+        self.buffers.setdefault(table, []).append(row)
+        for related_table, related_row in related:
+            self.buffers.setdefault(related_table, []).append(related_row)
+        self.pending += 1 + len(related)
+        if self.pending >= self.batch_size:
+            self.flush()
+            if self.autocommit and self.uncommitted >= self.commit_every:
+                self.commit()
+
+    def commit_due(self):
+        """Commit if `commit_every` rows are written since the last commit; for writers without `autocommit`."""
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def flush(self):
+        """Write all buffered rows without committing."""
+        if not self.pending:
+            return
+        started_at = time.perf_counter()
+        posts = self.buffers.get('posts')
+        if posts and 'Tags' in self.projections.get('posts', ('Tags',)):
+            # A post that is imported again gets the tags of its new row, not both
+            delete_post_tags(self.conn, [row[0] for row in posts])
+        for table, rows in self.buffers.items():
+            if rows:
+                try:
+                    self.write_table(table, rows)
+                except WriteError:
+                    raise
+                except Exception as error:
+                    if is_transient_error(error):
+                        raise
+                    raise WriteError(table, list(rows), error) from error
+                self.uncommitted += len(rows)
+                self.uncommitted_rows[table] = self.uncommitted_rows.get(table, 0) + len(rows)
+                rows.clear()
+        self.pending = 0
+        if self.metrics:
+            self.metrics.observe_insert(time.perf_counter() - started_at)
+
+    def add_all(self, table, rows):
+        """
+        Write rows in batches without the commits `add` may do in between, so the next
+        commit makes all of them durable together, e.g. counters that must be added once.
+        """
+        for start in range(0, len(rows), self.batch_size):
+            batch = rows[start:start + self.batch_size]
+            self.buffers.setdefault(table, []).extend(batch)
+            self.pending += len(batch)
+            self.flush()
+
+    def write_table(self, table, rows):
+        if table in self.fulltext:
+            write_fulltext(self.conn, table, rows, self.write)
+        else:
+            self.write(table, rows)
+
+    def write(self, table, rows):
+        insert_rows(self.conn, table, rows, self.projections.get(table))
+
+    def rollback(self):
+        """Drop the buffered rows and roll back the ones written since the last commit."""
+        for rows in self.buffers.values():
+            rows.clear()
+        self.pending = 0
+        self.uncommitted = 0
+        self.uncommitted_rows = {}
+        self.conn.rollback()
+
+    def check(self, table, rows):
+        """Write rows in a transaction that is rolled back; return the error of the database, or None."""
+        try:
+            self.write_table(table, rows)
+            return None
+        except Exception as error:
+            if is_transient_error(error):
+                raise
+            return error
+        finally:
+            self.rollback()
+
+    def failing_rows(self, table, rows):
+        """
+        Return the (row, error) of the rows of a rejected batch that the database rejects
+        on their own, checking halves of the batch so a few bad rows among thousands cost
+        a few statements each. Call it after `rollback`.
+        """
+        error = self.check(table, rows)
+        if error is None:
+            return []
+        if len(rows) == 1:
+            return [(rows[0], error)]
+        middle = len(rows) // 2
+        return self.failing_rows(table, rows[:middle]) + self.failing_rows(table, rows[middle:])
+
+    def commit(self):
+        self.flush()
+        if self.before_commit:
+            self.before_commit()
+            self.flush()
+        started_at = time.perf_counter()
+        self.conn.commit()
+        if self.metrics:
+            self.metrics.observe_commit(time.perf_counter() - started_at)
+        self.uncommitted = 0
+        for table, count in self.uncommitted_rows.items():
+            self.committed_rows[table] = self.committed_rows.get(table, 0) + count
+        self.uncommitted_rows = {}
+        if self.on_commit:
+            self.on_commit()
+
+    def close(self):
+        """Write and commit whatever is still buffered."""
+        self.commit()
+
+def _csv_value(value):
+    # Strings are always quoted, so only the unquoted empty field written for None is read as NULL
+    if value is None:
+        return ''
+    if isinstance(value, str):
+        return '"' + value.replace('"', '""') + '"'
+    if isinstance(value, bytes):
+        # The hex input format of bytea
+        return '\\x' + value.hex()
+    return str(value)
+
+def _csv_line(row):
+    return ','.join(_csv_value(value) for value in row) + '\n'
+
+def unique_rows(table, rows):
+    """
+    Keep one row per primary key of a batch, the last one like sequential upserts would.
+    Set based merges (`INSERT ... SELECT ... ON CONFLICT`) fail on a key that occurs twice.
+    """
+    key = [column_index(table, name) for name in primary_key(table)]
+    if key == [0]:
+        return list({row[0]: row for row in rows}.values())
+    return list({tuple(row[i] for i in key): row for row in rows}.values())
+
+class CopyWriter(BatchWriter):
+    """
+    Bulk writer for POSTGRES.
+    Each batch is streamed with `COPY ... FROM STDIN` into a staging table and then
+    merged into the destination table with a single `INSERT ... ON CONFLICT`, so the
+    upsert semantics of `insert_rows` still hold.
+    """
+
+    def __init__(self, conn, batch_size=50000, commit_every=200000, on_commit=None):
+        super().__init__(conn, batch_size, commit_every, on_commit)
+        self.staging_tables = set()
+
+    def staging_table(self, table):
+        staging = f"{table}_staging"
+        if staging not in self.staging_tables:
+            # Temporary tables are never WAL-logged and are private to the session,
+            # so parallel imports do not share (or lock) each other's staging table
+            cursor = get_cursor(self.conn)
+            cursor.execute(f"CREATE TEMPORARY TABLE IF NOT EXISTS {staging} (LIKE {table} INCLUDING DEFAULTS)")
+            self.staging_tables.add(staging)
+        return staging
+
+    def write(self, table, rows):
+        columns = column_names(table)
+        staging = self.staging_table(table)
+        rows = unique_rows(table, rows)
+
+        buffer = io.StringIO()
+        buffer.writelines(_csv_line(row) for row in rows)
+        buffer.seek(0)
+
+        cursor = get_cursor(self.conn)
+        column_list = ', '.join(columns)
+        cursor.copy_expert(f"COPY {staging} ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
+        cursor.execute(f'''
+        INSERT INTO {table} ({column_list})
+        SELECT {column_list} FROM {staging}
+        {on_conflict_sql(table, self.projections.get(table))}
+        ''')
+        cursor.execute(f"TRUNCATE {staging}")
+
+    def rollback(self):
+        super().rollback()
+        # Staging tables created in the transaction are gone
+        self.staging_tables.clear()
+
+class ParquetSink:
+    """
+    The "connection" of the PARQUET output: a directory with one subdirectory per table,
+    partitioned by the year of `CreationDate` (`posts/year=2008/part-....parquet`), which
+    pandas, Spark and pyarrow read as one dataset.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def table_path(self, table):
+        return os.path.join(self.path, table)
+
+    def read_columns(self, table, columns):
+        """Return the values of some columns of a table as lists; empty lists if it has no files yet."""
+        import pyarrow.dataset as ds
+        path = self.table_path(table)
+        if not os.path.isdir(path):
+            return [[] for _ in columns]
+        data = ds.dataset(path, format='parquet', partitioning='hive').to_table(columns=list(columns))
+        return [data.column(name).to_pylist() for name in columns]
+
+    def commit(self):
+        # Files are committed by the writer
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+# Arrow type of every column type of `schema.TABLES`
+ARROW_TYPES = {'int': 'int64', 'bigint': 'int64', 'bool': 'bool_', 'datetime': 'timestamp', 'text': 'string', 'bytes': 'binary'}
+
+def arrow_schema(table):
+    """Return the Arrow schema of a table."""
+    import pyarrow as pa
+    fields = []
+    for name, column_type in column_types(table):
+        arrow_type = pa.timestamp('ms') if column_type == 'datetime' else getattr(pa, ARROW_TYPES[column_type])()
+        fields.append(pa.field(name, arrow_type))
+    return pa.schema(fields)
+
+def arrow_batch(table, rows, schema=None):
+    """Turn a list of row tuples into an Arrow record batch, column by column."""
+    import pyarrow as pa
+    schema = schema or arrow_schema(table)
+    columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+    return pa.record_batch(columns, schema=schema)
+
+# Low-cardinality columns stored dictionary encoded in Parquet files
+DICTIONARY_COLUMNS = {
+    'posts': ('PostTypeId', 'ContentLicense'),
+    'comments': ('ContentLicense',),
+    'postlinks': ('LinkTypeId',),
+    'votes': ('VoteTypeId',),
+    'post_history': ('PostHistoryTypeId', 'ContentLicense'),
+    'badges': ('Name', 'Class'),
+}
+
+# Name of the partition of rows without a date, as Hive and Spark write it
+NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+
+class ParquetWriter(BatchWriter):
+    """
+    Writer for DBMS=PARQUET.
+    Rows are grouped per table and `CreationDate` year, turned into Arrow column batches
+    of `batch_size` rows and written as row groups. A commit closes the open files; until
+    then they are hidden (a leading dot), so a crash leaves no half written file behind
+    and the checkpoint recorded after the commit matches what is on disk. Files are only
+    added, never rewritten: delete a table directory before importing it again.
+    """
+
+    def __init__(self, conn, batch_size=100000, commit_every=1000000, on_commit=None):
+        super().__init__(conn, batch_size, commit_every, on_commit)
+        # Rows waiting for a full column batch and the open files, per (table, year)
+        self.partitions = {}
+        self.files = {}
+        self.sequence = 0
+        self.run_id = f"{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+
+    def write(self, table, rows):
+        date_index = column_index(table, 'CreationDate') if 'CreationDate' in column_names(table) else None
+        for row in rows:
+            year = None
+            if date_index is not None:
+                year = row[date_index].year if row[date_index] else NULL_PARTITION
+            buffer = self.partitions.setdefault((table, year), [])
+            buffer.append(row)
+            if len(buffer) >= self.batch_size:
+                self.write_batch(table, year, buffer)
+                buffer.clear()
+
+    def write_batch(self, table, year, rows):
+        import pyarrow.parquet as pq
+        key = (table, year)
+        schema = arrow_schema(table)
+        if key not in self.files:
+            directory = self.conn.table_path(table)
+            if year is not None:
+                directory = os.path.join(directory, f"year={year}")
+            os.makedirs(directory, exist_ok=True)
+            self.sequence += 1
+            name = f"part-{self.run_id}-{self.sequence:05d}.parquet"
+            hidden = os.path.join(directory, '.' + name)
+            dictionary = [column for column in DICTIONARY_COLUMNS.get(table, ()) if column in schema.names]
+            self.files[key] = (pq.ParquetWriter(hidden, schema, use_dictionary=dictionary, compression='zstd'), hidden, os.path.join(directory, name))
+        try:
+            batch = arrow_batch(table, rows, schema)
+        except Exception as error:
+            # Rows are only converted once a column batch is full, so report those rows
+            raise WriteError(table, list(rows), error) from error
+        self.files[key][0].write_batch(batch)
+
+    def rollback(self):
+        """Drop the buffered rows and delete the files that are not committed yet."""
+        for rows in self.buffers.values():
+            rows.clear()
+        for rows in self.partitions.values():
+            rows.clear()
+        for writer, hidden, path in self.files.values():
+            writer.close()
+            os.remove(hidden)
+        self.files.clear()
+        self.pending = 0
+        self.uncommitted = 0
+        self.uncommitted_rows = {}
+
+    def check(self, table, rows):
+        try:
+            arrow_batch(table, rows)
+            return None
+        except Exception as error:
+            return error
+
+    def write_partitions(self):
+        """Write the rows still waiting for a full column batch."""
+        for (table, year), rows in self.partitions.items():
+            if rows:
+                self.write_batch(table, year, rows)
+                rows.clear()
+
+    def commit(self):
+        self.flush()
+        self.write_partitions()
+        if self.before_commit:
+            self.before_commit()
+            self.flush()
+            self.write_partitions()
+        started_at = time.perf_counter()
+        for writer, hidden, path in self.files.values():
+            writer.close()
+            os.replace(hidden, path)
+        self.files.clear()
+        if self.metrics:
+            self.metrics.observe_commit(time.perf_counter() - started_at)
+        self.uncommitted = 0
+        for table, count in self.uncommitted_rows.items():
+            self.committed_rows[table] = self.committed_rows.get(table, 0) + count
+        self.uncommitted_rows = {}
+        if self.on_commit:
+            self.on_commit()
+
+class DuckDBWriter(BatchWriter):
+    """
+    Writer for DBMS=DUCKDB.
+    Each batch is handed to DuckDB as an Arrow record batch and merged with a single
+    `INSERT ... SELECT ... ON CONFLICT`, so rows are loaded column-wise instead of one
+    INSERT per row and re-runs keep the upsert semantics of `insert_rows`.
+    """
+
+    def __init__(self, conn, batch_size=10000, commit_every=100000, on_commit=None):
+        super().__init__(conn, batch_size, commit_every, on_commit)
+        self.in_transaction = False
+
+    def flush(self):
+        # DuckDB connections autocommit every statement unless a transaction is open
+        if not self.in_transaction and any(self.buffers.values()):
+            self.conn.begin()
+            self.in_transaction = True
+        super().flush()
+
+    def write(self, table, rows):
+        columns = ', '.join(column_names(table))
+        self.conn.register('staging_rows', arrow_batch(table, unique_rows(table, rows)))
+        try:
+            self.conn.execute(f'''
+            INSERT INTO {table} ({columns})
+            SELECT {columns} FROM staging_rows
+            {on_conflict_sql(table, self.projections.get(table))}
+            ''')
+        finally:
+            self.conn.unregister('staging_rows')
+
+    def commit(self):
+        super().commit()
+        self.in_transaction = False
+
+    def rollback(self):
+        for rows in self.buffers.values():
+            rows.clear()
+        self.pending = 0
+        self.uncommitted = 0
+        self.uncommitted_rows = {}
+        if self.in_transaction:
+            self.conn.rollback()
+            self.in_transaction = False
+
+    def check(self, table, rows):
+        self.conn.begin()
+        self.in_transaction = True
+        return super().check(table, rows)
+
+def open_writer(conn, batch_size=1000, commit_every=10000, bulk=False, on_commit=None):
+    """
+    Return the writer used by the import: the COPY based one for bulk loads on POSTGRES.
+    SQLITE bulk loads use the regular writer on a connection set up by `configure_bulk_load`.
+    DUCKDB always loads Arrow batches.
+    """
+    if get_dbms() == 'PARQUET':
+        return ParquetWriter(conn, batch_size, commit_every, on_commit)
+    if get_dbms() == 'DUCKDB':
+        return DuckDBWriter(conn, batch_size, commit_every, on_commit)
+    if bulk and get_dbms() == 'POSTGRES':
+        return CopyWriter(conn, batch_size, commit_every, on_commit)
+    return BatchWriter(conn, batch_size, commit_every, on_commit)
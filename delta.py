@@ -0,0 +1,88 @@
+import hashlib
+import re
+from datetime import datetime
+from database import get_dbms, read_row_hashes, read_watermark, update_watermark
+from schema import column_names
+from reader import chunk_positions
+
+# The Id and LastActivityDate attributes, read from the raw line without parsing it
+ROW_ID_REGEX = re.compile(rb'<row\s(?:[^>]*?\s)?Id="(\d+)"')
+LAST_ACTIVITY_REGEX = re.compile(rb'\sLastActivityDate="([^"]+)"')
+
+def row_hash(line):
+    """Return a compact (signed 64-bit) content hash of a raw row line."""
+    return int.from_bytes(hashlib.blake2b(line.strip(), digest_size=8).digest(), 'big', signed=True)
+
+class DeltaTracker:
+    """
+    Skips the rows of a dump that did not change since the previous delta import.
+    The hash of every raw row line is compared with the one stored in `row_hashes`
+    (looked up per chunk with one Id range query), before the row is parsed or converted
+    to Markdown; only new and changed rows go on to the writer, with their new hash.
+    For tables with a LastActivityDate the latest one is recorded as a watermark.
+    """
+
+    def __init__(self, conn, destination):
+        if get_dbms() == 'PARQUET':
+            raise ValueError("Delta imports need a database to look up the stored hashes, not DBMS=PARQUET")
+        self.conn = conn
+        self.destination = destination
+        self.has_activity = 'LastActivityDate' in column_names(destination)
+        self.previous_watermark = read_watermark(conn, destination) if self.has_activity else None
+        # The latest raw LastActivityDate seen; ISO 8601 text sorts in date order
+        self.watermark = None
+        # Hashes of the rows passed on to parsing, by Id, until they are queued for writing
+        self.hashes = {}
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+
+    def filter(self, chunks):
+        """Drop the unchanged rows (and the lines that are not rows) from chunks (see `reader.read_chunks`)."""
+        for lines, line_count, size, positions in chunks:
+            keyed = []
+            for line, position in zip(lines, chunk_positions(lines, positions)):
+                match = ROW_ID_REGEX.search(line)
+                if match:
+                    keyed.append((int(match.group(1)), line, position))
+            stored = read_row_hashes(self.conn, self.destination, min(keyed)[0], max(keyed)[0]) if keyed else {}
+            changed = []
+            changed_positions = []
+            for row_id, line, position in keyed:
+                if self.has_activity:
+                    match = LAST_ACTIVITY_REGEX.search(line)
+                    if match and (self.watermark is None or match.group(1) > self.watermark):
+                        self.watermark = match.group(1)
+                new_hash = row_hash(line)
+                previous_hash = stored.get(row_id)
+                if previous_hash == new_hash:
+                    self.unchanged += 1
+                    continue
+                if previous_hash is None:
+                    self.inserted += 1
+                else:
+                    self.updated += 1
+                self.hashes[row_id] = new_hash
+                changed.append(line)
+                changed_positions.append(position)
+            yield changed, line_count, size, changed_positions
+
+    def related_rows(self, row):
+        """Return the `row_hashes` row to write together with a parsed row."""
+        new_hash = self.hashes.pop(row[0], None)
+        if new_hash is None:
+            return ()
+        return (('row_hashes', (self.destination, row[0], new_hash)),)
+
+    def new_watermark(self):
+        """Return the latest LastActivityDate of this import, or None."""
+        if self.watermark is None:
+            return None
+        return datetime.fromisoformat(self.watermark.decode('ascii'))
+
+    def save_watermark(self):
+        if self.watermark is not None:
+            update_watermark(self.conn, self.destination, self.new_watermark())
+
+    def counts(self):
+        return {'inserted': self.inserted, 'updated': self.updated, 'unchanged': self.unchanged}
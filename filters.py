@@ -0,0 +1,110 @@
+import re
+from rowparser import xml_unescape, tag_names
+from reader import chunk_positions
+from schema import CONVERTERS, column_names, column_types, primary_key
+
+# A condition of --where: a column, an operator and a value, e.g. `PostTypeId = 1`,
+# `CreationDate >= 2015-01-01`, `Id < 1000000` or `Tags in python,pandas`
+CONDITION_REGEX = re.compile(r'^\s*(\w+)\s*(<=|>=|!=|=|<|>|\s+in\s+)\s*(.*?)\s*$', re.IGNORECASE)
+
+_COMPARISONS = {
+    '=': lambda value, expected: value == expected,
+    '!=': lambda value, expected: value != expected,
+    '<': lambda value, expected: value < expected,
+    '<=': lambda value, expected: value <= expected,
+    '>': lambda value, expected: value > expected,
+    '>=': lambda value, expected: value >= expected,
+    'in': lambda value, expected: value in expected,
+}
+
+def tag_set(value):
+    """Return the set of tag names of a decoded `Tags` value (see `rowparser.tag_names`)."""
+    return set(tag_names(value))
+
+def projected_columns(table, names):
+    """
+    Return the columns of a table to fill for the comma separated `names` of --columns,
+    in table order and always with the primary key; the other columns are left NULL.
+    """
+    wanted = {name.strip() for name in names.split(',') if name.strip()}
+    unknown = wanted - set(column_names(table))
+    if unknown:
+        raise ValueError(f"Unknown columns of {table}: {', '.join(sorted(unknown))} (available: {', '.join(column_names(table))})")
+    wanted.update(primary_key(table))
+    return tuple(name for name in column_names(table) if name in wanted)
+
+class RowFilter:
+    """
+    Drops the rows of a dump that do not match all --where conditions, before they are
+    parsed or converted to Markdown. Only the attributes of the conditions are read from
+    the raw line; a row without the attribute does not match (like NULL in SQL).
+    On `Tags`, `=` keeps posts with all of the listed tags, `in` with any and `!=` with none.
+    """
+
+    def __init__(self, table, conditions):
+        types = dict(column_types(table))
+        self.conditions = []
+        for text in conditions:
+            match = CONDITION_REGEX.match(text)
+            if not match:
+                raise ValueError(f"Invalid condition: {text!r}, expected e.g. 'PostTypeId = 1' or 'Tags in python,pandas'")
+            name, operator, value = match.group(1), match.group(2).strip().lower(), match.group(3)
+            if name not in types:
+                raise ValueError(f"Unknown column of {table} in condition {text!r} (available: {', '.join(types)})")
+            if name == 'Tags' and table == 'posts':
+                if operator not in ('=', '!=', 'in'):
+                    raise ValueError(f"Tags only supports =, != and in, not {operator}")
+                convert = tag_set
+                expected = tag_set(value)
+            else:
+                convert = CONVERTERS[types[name]]
+                try:
+                    expected = {convert(item.strip()) for item in value.split(',')} if operator == 'in' else convert(value)
+                except ValueError as e:
+                    raise ValueError(f"Invalid {types[name]} value in condition {text!r}: {e}") from e
+            attribute = re.compile(rb'\s' + name.encode('ascii') + rb'="([^"]*)"')
+            self.conditions.append((attribute, convert, operator, expected, name == 'Tags' and table == 'posts'))
+        self.kept = 0
+        self.filtered = 0
+
+    def matches(self, line):
+        """Whether a raw (bytes or text) `<row` line matches every condition."""
+        if isinstance(line, str):
+            line = line.encode('utf-8')
+        for attribute, convert, operator, expected, is_tags in self.conditions:
+            match = attribute.search(line)
+            if not match:
+                return False
+            raw = match.group(1)
+            try:
+                value = int(raw) if convert is int else convert(xml_unescape(raw.decode('utf-8', errors='replace')))
+            except ValueError:
+                # Left to the parser, which fails on the same value and quarantines the row
+                continue
+            if is_tags:
+                if operator == 'in':
+                    matched = bool(value & expected)
+                elif operator == '=':
+                    matched = expected <= value
+                else:
+                    matched = not value & expected
+            else:
+                matched = _COMPARISONS[operator](value, expected)
+            if not matched:
+                return False
+        return True
+
+    def filter(self, chunks):
+        """Drop the rows that do not match from chunks (see `reader.read_chunks`); other lines pass."""
+        for lines, line_count, size, positions in chunks:
+            kept = []
+            kept_positions = []
+            for line, position in zip(lines, chunk_positions(lines, positions)):
+                if b'<row' in line:
+                    if not self.matches(line):
+                        self.filtered += 1
+                        continue
+                    self.kept += 1
+                kept.append(line)
+                kept_positions.append(position)
+            yield kept, line_count, size, kept_positions
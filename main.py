@@ -2,13 +2,20 @@ import os
 import argparse
 from dotenv import load_dotenv
 
-def main(input_file_path=None, destination_table=None, start_line_number=1, convert_to_md=True):
+def main(input_file_path=None, destination_table=None, start_line_number=1, convert_to_md=True, shards=1, shard_index=None, **options):
+    """`options` are passed on to `api.process_xml_file` (batch_size, commit_every, bulk, workers, resume, engine, delta, ...)."""
     from colored import fg, attr
     from utils import list_xml_files, read_yes_no, read_integer, read_first_node
-    from api import process_xml_file
+    from api import process_xml_file, process_xml_file_sharded
+    from schema import XML_TYPES
 
-    if input_file_path and destination_table:
-        process_xml_file(input_file_path, destination_table, start_line_number, convert_to_md)
+    if input_file_path and destination_table and shards > 1:
+        if shard_index is None:
+            process_xml_file_sharded(input_file_path, destination_table, shards, convert_to_md, **options)
+        else:
+            process_xml_file(input_file_path, destination_table, 1, convert_to_md, shard=(shard_index, shards), **options)
+    elif input_file_path and destination_table:
+        process_xml_file(input_file_path, destination_table, start_line_number, convert_to_md, **options)
     else:
         red = fg('red')    
         blue = fg('blue')
@@ -23,6 +30,8 @@ def main(input_file_path=None, destination_table=None, start_line_number=1, conv
             print("1. Select the input folder")
             print("2. Select the input file")
             print("3. Select the output table")        
+            print("4. Build the secondary indexes")
+            print("5. Import all files of the input folder")
             command = input(f"Enter a command number: {reset}").strip()
 
             if command == "0":
@@ -58,7 +67,7 @@ def main(input_file_path=None, destination_table=None, start_line_number=1, conv
                     print(f"{red}Invalid file number. Try again.{reset}")                    
             elif command == "3":
                 # Store the types in a list
-                types = ["Votes", "Users", "Tags", "PostLinks", "Posts", "Comments"]
+                types = list(XML_TYPES)
                 
                 # Display the options to the user
                 print(f"{blue}Please select a type by entering the corresponding number:{reset}")
@@ -82,25 +91,147 @@ def main(input_file_path=None, destination_table=None, start_line_number=1, conv
                             if should_read:
                                 start_line_number = read_integer(f"{blue}Please enter the start line number: {reset}")
                             convert_to_md = read_yes_no(f"{blue}Do you want to convert texts to MD?{reset}")   
-                            process_xml_file(path, selected_type, start_line_number, convert_to_md)                        
+                            process_xml_file(path, selected_type, start_line_number, convert_to_md, **options)                        
                     else:
                         print(f"{red}Invalid choice, please enter a number within the provided range.{reset}")
                 except ValueError:
                     print(f"{red}Invalid input, please enter a numerical value.{reset}")
+            elif command == "4":
+                build_secondary_indexes()
+            elif command == "5":
+                from scheduler import import_all
+                input_folder = os.environ.get('INPUT_FOLDER', './inputs')
+                convert_to_md = read_yes_no(f"{blue}Do you want to convert texts to MD?{reset}")
+                import_all(input_folder, None, convert_to_md, **options)
             else:
                 print(f"{red}Unknown command number. Please try again.{reset}")  
 
+def build_secondary_indexes(parallel_workers=4):
+    """Build the secondary indexes after the tables are loaded and report how long each one took."""
+    from colored import fg, attr
+    from database import open_connection, close_connection, create_tables, build_indexes
+    green = fg('green')
+    cyan = fg('cyan')
+    reset = attr('reset')
+    conn = open_connection()
+    try:
+        create_tables(conn)
+        for name, seconds in build_indexes(conn, parallel_workers):
+            if seconds is None:
+                print(f"{cyan}    {name}: already exists{reset}")
+            else:
+                print(f"{green}    {name}: built in {seconds:.1f}s{reset}")
+    finally:
+        close_connection(conn)
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(description='Stackoverflow XML CLI Processor')
+    parser.add_argument('command', type=str, nargs='?', choices=['import-all'], help='import-all: import every dump file of --input_folder into the table named by the file, '
+                        'several files at a time, largest first')
+    parser.add_argument('--input_folder', type=str, default='./inputs', help='Folder searched by import-all (default is ./inputs)')
+    parser.add_argument('--jobs', type=int, help='Number of files import-all imports at the same time, each in its own process and connection (default is the number of CPUs); '
+                        'every job also starts --workers parsing processes')
     parser.add_argument('--input_file_path', type=str, help='Path to the input file')
-    parser.add_argument('--destination_table', type=str, help='Destination table {Votes, Users, Tags, PostLinks, Posts, Comments}')
+    parser.add_argument('--destination_table', type=str, help='Destination table {Votes, Users, Tags, PostLinks, Posts, Comments, PostHistory, Badges}')
     parser.add_argument('--start_line_number', type=int, default=1, help='Start line number (default is 1)')
     parser.add_argument('--convert_to_md', type=bool, default=True, help='Convert texts to Markdown (default is True)')
+    parser.add_argument('--batch_size', type=int, default=1000, help='Number of rows written per batch (default is 1000)')
+    parser.add_argument('--commit_every', type=int, default=10000, help='Number of rows written per transaction (default is 10000)')
+    parser.add_argument('--bulk', action='store_true', help='Bulk load. On POSTGRES rows are streamed with COPY into a staging table and merged per batch (use a larger --batch_size, e.g. 50000). '
+                        'On SQLITE the database is written without fsync (synchronous=OFF), with a 1 GiB cache, mmap and in-memory temp storage, and with a 32 KiB page size if the file is new; '
+                        'if the machine crashes during the load the last commits may be lost, so keep the dump to re-run it. Safe settings are restored and ANALYZE runs when the load finishes')
+    parser.add_argument('--journal_mode', type=str, default='WAL', choices=['WAL', 'OFF'], help='SQLITE journal mode of a --bulk load (default is WAL). WAL survives a crash of the importer; '
+                        'OFF is faster but a crash in the middle of a transaction can corrupt the database')
+    parser.add_argument('--workers', type=int, default=1, help='Number of processes that parse and convert rows to Markdown (default is 1, no worker processes)')
+    parser.add_argument('--resume', action='store_true', help='Continue from the checkpoint written next to the input file by a previous run')
+    parser.add_argument('--build_line_index', action='store_true', help='Build the line index of the input file so --start_line_number can seek directly, then exit')
+    parser.add_argument('--shards', type=int, default=1, help='Split the input file into this many byte ranges and import them in parallel, one process and connection each (default is 1)')
+    parser.add_argument('--shard_index', type=int, default=os.getenv('SLURM_ARRAY_TASK_ID'), help='Import only this shard (0-based) of --shards; defaults to SLURM_ARRAY_TASK_ID in a Slurm array job')
+    parser.add_argument('--slurm_array_script', type=str, help='Write a Slurm array job script that imports the input file with one task per shard to this path, '
+                        'and a script that runs --finish_shards once the array job is done, then exit')
+    parser.add_argument('--finish_shards', action='store_true', help='Once every shard of --shards is imported (e.g. by the tasks of a Slurm array job), merge their post stats, '
+                        'build the --fulltext indexes and finish the --bulk load, then exit')
+    parser.add_argument('--parser', type=str, default='regex', choices=['regex', 'expat', 'lxml'], help='Row parser engine (default is regex; lxml needs the lxml package)')
+    parser.add_argument('--build_indexes', action='store_true', help='Build the secondary indexes on the join keys (run it after the bulk load), then exit')
+    parser.add_argument('--index_workers', type=int, default=4, help='Parallel workers (POSTGRES) or sorter threads (SQLITE) used by --build_indexes (default is 4)')
+    parser.add_argument('--delta', action='store_true', help='Delta import of a newer dump: skip the rows whose content hash did not change since the last --delta import, '
+                        'before they are parsed and converted, and report the inserted, updated and unchanged rows')
+    parser.add_argument('--compact_history', action='store_true', help='Store the Text of a PostHistory revision as a zlib delta against the previous revision of the same post '
+                        '(Text NULL, BaseId and TextDelta set); revisions.rebuild_revision returns the full text')
+    parser.add_argument('--fulltext', action='store_true', help='Index posts.Title/Body and comments.Text for full-text search (see search.py): an FTS5 table filled in the same transactions on SQLITE, '
+                        'a generated tsvector column with a GIN index built after the load on POSTGRES')
+    parser.add_argument('--columns', type=str, help='Only fill these comma separated columns (the primary key always), e.g. Id,PostId,VoteTypeId; the others are written as NULL '
+                        'and a Body that is not among them is not converted to Markdown')
+    parser.add_argument('--where', type=str, action='append', help='Only import the rows matching this condition, checked on the raw row before parsing; repeat it to combine conditions with AND. '
+                        "E.g. 'PostTypeId = 1', 'Tags in python,pandas', 'CreationDate >= 2015-01-01', 'Id < 1000000' (operators =, !=, <, <=, >, >=, in)")
+    parser.add_argument('--max_retries', type=int, default=8, help='Restarts from the last checkpoint after a lost connection or a batch without new rows to reject, '
+                        'before the import gives up (default is 8; counted again from zero after every checkpoint)')
+    parser.add_argument('--replay_quarantine', type=str, help='Import the rows of a quarantine file written by an import (<input file>.quarantine.jsonl) again, then exit; '
+                        'the rows that fail again stay in the file')
+    parser.add_argument('--no_post_stats', action='store_true', help='Do not count the votes by type and the comments of every post into post_vote_stats and post_comment_stats '
+                        'while Votes and Comments are imported')
+    parser.add_argument('--metrics_file', type=str, help='Append the throughput of every stage (rows/sec, bytes/sec, parse, convert and insert times, insert latency histogram, ETA) '
+                        'to this file as JSON lines; use - to write them to stdout, e.g. into the log of a Slurm job')
+    parser.add_argument('--metrics_interval', type=float, default=10, help='Seconds between two --metrics_file records (default is 10)')
+    parser.add_argument('--profile', type=str, nargs='?', const='import.prof', help='Run under cProfile, print the slowest functions and save the stats to this file (default is import.prof); '
+                        'with --workers only the reading and writing process is profiled')
     parser.add_argument('--env', type=str, help='Path to the environment file')
     
     args = parser.parse_args()
+    from schema import XML_TYPES
+    if args.destination_table and args.destination_table not in XML_TYPES:
+        parser.error(f"Unknown --destination_table {args.destination_table} (available: {', '.join(XML_TYPES)})")
+    if (args.columns or args.where) and args.destination_table:
+        from filters import RowFilter, projected_columns
+        try:
+            if args.where:
+                RowFilter(XML_TYPES[args.destination_table], args.where)
+            if args.columns:
+                projected_columns(XML_TYPES[args.destination_table], args.columns)
+        except ValueError as e:
+            parser.error(str(e))
     
     load_dotenv(args.env)
     
-    main(args.input_file_path, args.destination_table, args.start_line_number, args.convert_to_md)
+    options = dict(batch_size=args.batch_size, commit_every=args.commit_every, bulk=args.bulk, workers=args.workers, resume=args.resume, engine=args.parser,
+                   journal_mode=args.journal_mode, metrics_file=args.metrics_file, metrics_interval=args.metrics_interval, delta=args.delta,
+                   compact_history=args.compact_history, fulltext=args.fulltext,
+                   columns=args.columns, where=args.where, post_stats=not args.no_post_stats, max_retries=args.max_retries)
+    if args.command == 'import-all':
+        if args.columns or args.where:
+            parser.error("--columns and --where name the columns of one table; use them with --input_file_path")
+        from scheduler import import_all
+        import_all(args.input_folder, args.jobs, args.convert_to_md, **options)
+    elif args.replay_quarantine:
+        from api import replay_quarantine
+        replay_quarantine(args.replay_quarantine, args.convert_to_md, args.parser, not args.no_post_stats)
+    elif args.build_indexes:
+        build_secondary_indexes(args.index_workers)
+    elif args.slurm_array_script:
+        from slurm import write_slurm_array_script, write_slurm_finish_script
+        template = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'run_stackoverflow_job.slurm')
+        array_script = write_slurm_array_script(template, args.slurm_array_script, os.path.abspath(args.input_file_path), args.destination_table, args.shards)
+        finish_script = write_slurm_finish_script(template, array_script, os.path.abspath(args.input_file_path), args.destination_table, args.shards)
+        print(f"Wrote {array_script} and {finish_script}; submit them with:")
+        print(f"  sbatch --dependency=afterany:$(sbatch --parsable {array_script}) {finish_script}")
+    elif args.finish_shards:
+        if not (args.input_file_path and args.destination_table and args.shards > 1):
+            parser.error("--finish_shards needs the --input_file_path, --destination_table and --shards of the sharded import")
+        from api import finish_shards
+        finish_shards(args.input_file_path, args.destination_table, args.shards, args.bulk, args.fulltext, not args.no_post_stats, args.delta)
+    elif args.build_line_index:
+        from reader import build_line_index
+        print(f"Indexed {build_line_index(args.input_file_path)} offsets of {args.input_file_path}")
+    else:
+        run = lambda: main(args.input_file_path, args.destination_table, args.start_line_number, args.convert_to_md, args.shards, args.shard_index, **options)
+        if args.profile:
+            import cProfile
+            import pstats
+            profiler = cProfile.Profile()
+            profiler.runcall(run)
+            profiler.dump_stats(args.profile)
+            print(f"\nProfile saved to {args.profile}; the functions taking the most time:")
+            pstats.Stats(profiler).sort_stats('tottime').print_stats(25)
+        else:
+            run()
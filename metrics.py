@@ -0,0 +1,93 @@
+import json
+import sys
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+# Upper bounds in milliseconds of the insert latency histogram; the last bucket counts the slower batches
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+class ImportMetrics:
+    """
+    Counters and timers of the stages of an import: parsing, Markdown conversion,
+    inserts (with a latency histogram of the written batches) and commits.
+    Every `interval` seconds a snapshot is appended as one JSON line to `path`
+    (`-` for stdout, e.g. the log of a Slurm job); without a path nothing is written.
+    """
+
+    def __init__(self, path=None, interval=10, total_bytes=0, **labels):
+        self.path = path
+        self.interval = interval
+        self.total_bytes = total_bytes
+        # Written with every record, e.g. the input file, the table and the shard
+        self.labels = labels
+        self.started_at = time.perf_counter()
+        self.last_emitted_at = self.started_at
+        self.lines = 0
+        self.rows = 0
+        self.bytes = 0
+        self.conversion_errors = 0
+        # Seconds spent per stage; in worker processes parse and convert add up the time of every worker
+        self.seconds = {'parse': 0.0, 'insert': 0.0, 'commit': 0.0}
+        self.insert_latencies = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        # Markdown converter counters (hits, misses, seconds) per converting process
+        self.converters = {}
+
+    def observe_insert(self, seconds):
+        """Record the time it took to write a batch."""
+        self.seconds['insert'] += seconds
+        self.insert_latencies[bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+
+    def observe_commit(self, seconds):
+        self.seconds['commit'] += seconds
+
+    def due(self, now):
+        return self.path is not None and now - self.last_emitted_at >= self.interval
+
+    def snapshot(self, processed_bytes):
+        """Return the counters and the derived rates; `processed_bytes` is the progress through `total_bytes`."""
+        elapsed = max(time.perf_counter() - self.started_at, 1e-9)
+        hits = sum(counters[0] for counters in self.converters.values())
+        misses = sum(counters[1] for counters in self.converters.values())
+        convert_seconds = sum(counters[2] for counters in self.converters.values())
+        progress = processed_bytes / self.total_bytes if self.total_bytes else None
+        eta = None
+        if progress:
+            eta = elapsed * (1 - progress) / progress
+        buckets = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            'time': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            **self.labels,
+            'elapsed_seconds': round(elapsed, 3),
+            'lines': self.lines,
+            'rows': self.rows,
+            'bytes': self.bytes,
+            'rows_per_sec': round(self.rows / elapsed, 1),
+            'bytes_per_sec': round(self.bytes / elapsed, 1),
+            'conversion_errors': self.conversion_errors,
+            'markdown_cache_hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+            'stage_seconds': {
+                # The parse time includes the conversions, report them apart
+                'parse': round(self.seconds['parse'] - convert_seconds, 3),
+                'convert': round(convert_seconds, 3),
+                'insert': round(self.seconds['insert'], 3),
+                'commit': round(self.seconds['commit'], 3),
+            },
+            'insert_latency_histogram': dict(zip(buckets, self.insert_latencies)),
+            'progress': round(progress, 4) if progress is not None else None,
+            'eta_seconds': round(eta, 1) if eta is not None else None,
+        }
+
+    def emit(self, processed_bytes, **fields):
+        """Append a snapshot, with extra `fields` (e.g. final=True), to the metrics file."""
+        self.last_emitted_at = time.perf_counter()
+        if self.path is None:
+            return
+        line = json.dumps({**self.snapshot(processed_bytes), **fields}) + '\n'
+        if self.path == '-':
+            sys.stdout.write(line)
+            sys.stdout.flush()
+        else:
+            # One write per line in append mode, so shards can share a file
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(line)
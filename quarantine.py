@@ -0,0 +1,68 @@
+import json
+import os
+
+def quarantine_path(path, shard=None):
+    """Return the quarantine file of a dump file, or of one `(index, count)` shard of it."""
+    if shard:
+        index, count = shard
+        return f"{path}.shard{index}of{count}.quarantine.jsonl"
+    return path + '.quarantine.jsonl'
+
+def read_quarantine(path):
+    """Return the entries of a quarantine file, in the order they were added."""
+    with open(path, 'r', encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def write_quarantine(path, entries):
+    """Replace the entries of a quarantine file, deleting it once there are none left."""
+    if not entries:
+        if os.path.exists(path):
+            os.remove(path)
+        return
+    with open(path + '.tmp', 'w', encoding='utf-8') as file:
+        file.writelines(json.dumps(entry) + '\n' for entry in entries)
+    os.replace(path + '.tmp', path)
+
+class Quarantine:
+    """
+    The rows of a dump that could not be imported, appended to a JSON lines file next to
+    it, so the import goes on without them. Every entry has the dump file and type, the
+    line number and byte offset of the row, the stage that failed (`parse`, or `write` for
+    a row the database rejected), the error and the raw line. Lines that are not valid
+    UTF-8 are kept byte for byte (with surrogate escapes), so `api.replay_quarantine` can
+    import them again once the cause is fixed.
+    """
+
+    def __init__(self, path, xml_type, shard=None, append=False):
+        self.source = path
+        self.xml_type = xml_type
+        self.path = quarantine_path(path, shard)
+        self.counts = {'parse': 0, 'write': 0}
+        # Byte offsets of the quarantined rows: rows are read again after a restart or a resume
+        self.offsets = set()
+        if append and os.path.exists(self.path):
+            self.offsets.update(entry['byte_offset'] for entry in read_quarantine(self.path))
+        elif os.path.exists(self.path):
+            # A new import starts a new quarantine
+            os.remove(self.path)
+
+    def add(self, line, line_number, byte_offset, stage, error):
+        if byte_offset in self.offsets:
+            return
+        entry = {
+            'file': self.source,
+            'type': self.xml_type,
+            'line_number': line_number,
+            'byte_offset': byte_offset,
+            'stage': stage,
+            'error': error if isinstance(error, str) else f"{type(error).__name__}: {error}",
+            'line': line.decode('utf-8', errors='surrogateescape').rstrip('\r\n'),
+        }
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(entry) + '\n')
+        self.offsets.add(byte_offset)
+        self.counts[stage] += 1
+
+    @property
+    def count(self):
+        return sum(self.counts.values())
@@ -0,0 +1,337 @@
+import io
+import mmap
+import os
+import queue
+import shutil
+import subprocess
+import threading
+from array import array
+
+# Every how many lines the line index stores a byte offset
+LINE_INDEX_STRIDE = 10000
+
+# Dumps can be read straight from these archives, decompressing while streaming
+COMPRESSED_EXTENSIONS = ('.7z', '.bz2', '.gz', '.zst')
+
+# Size of the blocks read (and dropped) when skipping forward in a compressed stream
+SKIP_BLOCK_SIZE = 1 << 20
+
+
+def is_compressed(path):
+    return path.lower().endswith(COMPRESSED_EXTENSIONS)
+
+class _PipeReader(io.RawIOBase):
+    """A raw stream over a pipe (or a `read` callable) that counts the bytes read, so `tell` works."""
+
+    def __init__(self, read):
+        self._read = read
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._read(len(buffer))
+        size = len(data)
+        buffer[:size] = data
+        self.position += size
+        return size
+
+    def tell(self):
+        return self.position
+
+class _QueueWriter:
+    """Receives the decompressed data of py7zr (a `Py7zIO` writer) and hands it over to a queue."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.written = 0
+
+    def write(self, data):
+        self.chunks.put(bytes(data))
+        self.written += len(data)
+        return len(data)
+
+    def read(self, size=None):
+        return b''
+
+    def seek(self, offset, whence=0):
+        return self.written
+
+    def flush(self):
+        pass
+
+    def size(self):
+        return self.written
+
+    def close(self):
+        pass
+
+def _open_7z_with_py7zr(path):
+    """Stream the first file of a 7z archive with py7zr, decompressing in a background thread."""
+    import py7zr
+    from py7zr.io import WriterFactory
+
+    # A bounded queue keeps memory flat: the thread waits while the reader is behind
+    chunks = queue.Queue(maxsize=16)
+    pending = bytearray()
+
+    class Factory(WriterFactory):
+        def create(self, filename):
+            return _QueueWriter(chunks)
+
+    def extract():
+        try:
+            with py7zr.SevenZipFile(path, 'r') as archive:
+                archive.extract(factory=Factory())
+        finally:
+            chunks.put(None)
+
+    def read(size):
+        while len(pending) < size:
+            chunk = chunks.get()
+            if chunk is None:
+                chunks.put(None)
+                break
+            pending.extend(chunk)
+        data = bytes(pending[:size])
+        del pending[:size]
+        return data
+
+    threading.Thread(target=extract, daemon=True).start()
+    with py7zr.SevenZipFile(path, 'r') as archive:
+        size = archive.archiveinfo().uncompressed
+    return read, size, None
+
+def _open_7z_with_binary(path, binary):
+    process = subprocess.Popen([binary, 'e', '-so', path], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    listing = subprocess.run([binary, 'l', '-slt', path], capture_output=True, text=True).stdout
+    size = sum(int(line.split('=', 1)[1]) for line in listing.splitlines() if line.startswith('Size = ') and line[7:].strip().isdigit())
+    return process.stdout.read, size, process
+
+class DumpFile:
+    """
+    A dump file opened for reading lines in binary mode, either plain or compressed
+    (.7z, .bz2, .gz or .zst). Offsets (`tell`, `seek`) always refer to the decompressed
+    data, while `progress` reports how far the file on disk has been read.
+    Plain files are memory mapped: seeking only moves the offset, lines are copied
+    straight out of the mapping and the offset of the mapping is the progress.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.compressed = is_compressed(path)
+        self.process = None
+        self.raw = None
+        # The total number of bytes `progress` counts towards
+        self.size = os.path.getsize(path)
+        lower = path.lower()
+        if lower.endswith('.7z'):
+            # The 7z format cannot be decompressed from Python's standard library; use the 7z
+            # command line tool when it is installed (fastest), else py7zr. Progress is then
+            # measured on the decompressed data, since neither exposes the archive position.
+            binary = shutil.which('7z') or shutil.which('7za') or shutil.which('7zz')
+            if binary:
+                read, self.size, self.process = _open_7z_with_binary(path, binary)
+            else:
+                read, self.size, self.process = _open_7z_with_py7zr(path)
+            self.stream = io.BufferedReader(_PipeReader(read), SKIP_BLOCK_SIZE)
+        else:
+            self.raw = open(path, 'rb')
+            if lower.endswith('.bz2'):
+                import bz2
+                self.stream = bz2.BZ2File(self.raw)
+            elif lower.endswith('.gz'):
+                import gzip
+                self.stream = gzip.GzipFile(fileobj=self.raw)
+            elif lower.endswith('.zst'):
+                import zstandard
+                reader = zstandard.ZstdDecompressor().stream_reader(self.raw, read_across_frames=True)
+                self.stream = io.BufferedReader(reader, SKIP_BLOCK_SIZE)
+            elif self.size:
+                # An empty file cannot be mapped
+                self.stream = mmap.mmap(self.raw.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.stream = self.raw
+        self.mapped = isinstance(self.stream, mmap.mmap)
+
+    def __iter__(self):
+        if self.mapped:
+            return iter(self.stream.readline, b'')
+        return iter(self.stream)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def readline(self):
+        return self.stream.readline()
+
+    def tell(self):
+        return self.stream.tell()
+
+    def seek(self, offset):
+        """Move to a decompressed byte offset; compressed streams can only move forward, by decompressing."""
+        if not self.compressed:
+            self.stream.seek(offset)
+            return offset
+        remaining = offset - self.tell()
+        if remaining < 0:
+            raise ValueError("A compressed dump can only be read forward")
+        while remaining > 0:
+            block = self.stream.read(min(remaining, SKIP_BLOCK_SIZE))
+            if not block:
+                break
+            remaining -= len(block)
+        return self.tell()
+
+    def progress(self):
+        """Return how many bytes of `size` are read: the position in the compressed file when it is known."""
+        if self.compressed and self.raw is not None:
+            return self.raw.tell()
+        return self.tell()
+
+    def chunks(self, chunk_size, limit=None):
+        """
+        Yield lists of up to `chunk_size` raw lines from the current position together with
+        their number and size in bytes, stopping once `limit` bytes were read (see `read_chunks`).
+        """
+        return read_chunks(read_lines(self, limit), chunk_size)
+
+    def close(self):
+        self.stream.close()
+        if self.raw is not None:
+            self.raw.close()
+        if self.process:
+            self.process.kill()
+            self.process.wait()
+
+def open_dump(path):
+    """Open a dump file, plain or compressed, for reading lines in binary mode."""
+    return DumpFile(path)
+
+def line_index_path(path):
+    return path + '.lineidx'
+
+def build_line_index(path, stride=LINE_INDEX_STRIDE):
+    """
+    Write the byte offset of every `stride`-th line of a file to its line index file.
+    The first item of the index is the stride itself. Returns the number of offsets written.
+    """
+    offsets = array('Q', [stride])
+    offset = 0
+    with open_dump(path) as file:
+        for number, line in enumerate(file):
+            if number % stride == 0:
+                offsets.append(offset)
+            offset += len(line)
+    index_path = line_index_path(path)
+    with open(index_path + '.tmp', 'wb') as index_file:
+        offsets.tofile(index_file)
+    os.replace(index_path + '.tmp', index_path)
+    return len(offsets) - 1
+
+def read_line_index(path):
+    """Return the stride and offsets of the line index of a file, or None if there is no up-to-date index."""
+    index_path = line_index_path(path)
+    if not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path):
+        return None
+    offsets = array('Q')
+    with open(index_path, 'rb') as index_file:
+        offsets.frombytes(index_file.read())
+    if len(offsets) < 2:
+        return None
+    return offsets[0], offsets[1:]
+
+def seek_to_line(file, path, line_number):
+    """
+    Position a file opened with `open_dump` at the start of the given (1-based) line
+    and return its byte offset. With a line index it seeks to the nearest indexed
+    line and reads at most `stride - 1` lines instead of the whole prefix.
+    """
+    from colored import fg, attr
+    magenta = fg('magenta')
+    reset = attr('reset')
+    skipped = line_number - 1
+    if skipped <= 0:
+        file.seek(0)
+        return 0
+    print(f"{magenta}Skipping to the start line ...{reset}")
+    index = read_line_index(path)
+    if index:
+        stride, offsets = index
+        slot = min(skipped // stride, len(offsets) - 1)
+        file.seek(offsets[slot])
+        skipped -= slot * stride
+    else:
+        file.seek(0)
+    for _ in range(skipped):
+        if not file.readline():
+            break
+    return file.tell()
+
+def read_lines(file, limit=None):
+    """Yield the raw lines of a binary file from its current position, stopping once `limit` bytes were read."""
+    if limit is None:
+        yield from file
+        return
+    consumed = 0
+    for line in file:
+        if consumed >= limit:
+            break
+        consumed += len(line)
+        yield line
+
+def read_chunks(lines, chunk_size):
+    """
+    Group raw lines into chunks of (lines, line count, size in bytes, positions) of up to
+    `chunk_size` lines. The positions of a chunk are None until lines are dropped from
+    it, see `chunk_positions`.
+    """
+    chunk = []
+    size = 0
+    for line in lines:
+        chunk.append(line)
+        size += len(line)
+        if len(chunk) >= chunk_size:
+            yield chunk, len(chunk), size, None
+            chunk = []
+            size = 0
+    if chunk:
+        yield chunk, len(chunk), size, None
+
+def chunk_positions(lines, positions):
+    """
+    Return the (line index, byte offset) within the chunk as read of every line of a chunk.
+    A filter that drops lines passes on the positions of the lines it keeps, so a row can
+    still be traced back to its line of the dump.
+    """
+    if positions is not None:
+        return positions
+    result = []
+    offset = 0
+    for index, line in enumerate(lines):
+        result.append((index, offset))
+        offset += len(line)
+    return result
+
+def compute_shards(path, shards):
+    """
+    Split a file into `shards` byte ranges `(start, end)` whose bounds fall on line starts,
+    so every `<row` line belongs to exactly one range. The split only depends on the file,
+    so independent processes (e.g. the tasks of a Slurm array) compute the same ranges.
+    """
+    if is_compressed(path):
+        raise ValueError("Sharding needs an uncompressed dump file, since compressed streams cannot be split by byte offset")
+    total_bytes = os.path.getsize(path)
+    bounds = [0]
+    with open(path, 'rb') as file:
+        for index in range(1, shards):
+            file.seek(max(total_bytes * index // shards - 1, bounds[-1]))
+            # Move to the start of the next line; the byte before the target may itself end a line
+            file.readline()
+            bounds.append(max(file.tell(), bounds[-1]))
+    bounds.append(total_bytes)
+    return list(zip(bounds[:-1], bounds[1:]))
@@ -0,0 +1,109 @@
+import zlib
+from collections import OrderedDict
+from schema import column_index
+
+# The field of a post that the Text of a PostHistory row holds, by PostHistoryTypeId
+# (initial, edit and rollback of the title, body and tags). Other types, e.g. close
+# reasons or migrations, are stored in full.
+REVISION_FIELDS = {
+    1: 'title', 4: 'title', 7: 'title',
+    2: 'body', 5: 'body', 8: 'body',
+    3: 'tags', 6: 'tags', 9: 'tags',
+}
+
+_ID = column_index('post_history', 'Id')
+_TYPE = column_index('post_history', 'PostHistoryTypeId')
+_POST_ID = column_index('post_history', 'PostId')
+_TEXT = column_index('post_history', 'Text')
+_BASE_ID = column_index('post_history', 'BaseId')
+_TEXT_DELTA = column_index('post_history', 'TextDelta')
+
+def compress_revision(text, previous):
+    """Compress `text` (bytes) with zlib, using the previous revision as the preset dictionary."""
+    compressor = zlib.compressobj(9, zdict=previous)
+    return compressor.compress(text) + compressor.flush()
+
+def decompress_revision(delta, previous):
+    decompressor = zlib.decompressobj(zdict=previous)
+    return decompressor.decompress(delta) + decompressor.flush()
+
+class RevisionCompactor:
+    """
+    Stores the PostHistory texts of a post as deltas. The first revision of a field (title,
+    body or tags) of a post keeps its full Text; a later one gets Text NULL, the Id of the
+    previous revision in BaseId and, in TextDelta, its text compressed with zlib against
+    the previous text as preset dictionary, so unchanged passages cost a few bytes.
+    Only the latest text of the `cache_size` most recently revised fields is kept; a
+    revision whose previous one was evicted (or imported by an earlier run) and every
+    `max_chain`-th revision in a row are stored in full again, which bounds the memory
+    and the number of deltas `rebuild_revision` has to apply.
+    """
+
+    def __init__(self, cache_size=200000, max_chain=16):
+        self.cache_size = cache_size
+        self.max_chain = max_chain
+        # (PostId, field) -> (Id, text as bytes, number of deltas since the last full text)
+        self.latest = OrderedDict()
+        self.full_bytes = 0
+        self.stored_bytes = 0
+
+    def compact(self, row):
+        """Return the post_history row tuple with its Text replaced by a delta where that is smaller."""
+        text = row[_TEXT]
+        field = REVISION_FIELDS.get(row[_TYPE])
+        if text is None or field is None or row[_POST_ID] is None:
+            return row
+        data = text.encode('utf-8')
+        self.full_bytes += len(data)
+        key = (row[_POST_ID], field)
+        previous = self.latest.pop(key, None)
+        delta = None
+        if previous and previous[0] < row[_ID] and previous[2] < self.max_chain:
+            delta = compress_revision(data, previous[1])
+            if len(delta) >= len(data):
+                delta = None
+        self.latest[key] = (row[_ID], data, previous[2] + 1 if delta is not None else 0)
+        if len(self.latest) > self.cache_size:
+            self.latest.popitem(last=False)
+        if delta is None:
+            self.stored_bytes += len(data)
+            return row
+        self.stored_bytes += len(delta)
+        row = list(row)
+        row[_TEXT] = None
+        row[_BASE_ID] = previous[0]
+        row[_TEXT_DELTA] = delta
+        return tuple(row)
+
+def _read_revision(conn, revision_id):
+    """Return the (Text, BaseId, TextDelta) of a post_history row, or None."""
+    from database import get_dbms, get_cursor, get_place_holder
+    if get_dbms() == 'PARQUET':
+        import pyarrow.dataset as ds
+        data = ds.dataset(conn.table_path('post_history'), format='parquet', partitioning='hive').to_table(
+            columns=['Text', 'BaseId', 'TextDelta'], filter=ds.field('Id') == revision_id).to_pylist()
+        return (data[0]['Text'], data[0]['BaseId'], data[0]['TextDelta']) if data else None
+    cursor = get_cursor(conn)
+    cursor.execute(f"SELECT Text, BaseId, TextDelta FROM post_history WHERE Id = {get_place_holder()}", (revision_id,))
+    return cursor.fetchone()
+
+def rebuild_revision(conn, revision_id):
+    """
+    Return the full Text of a post_history row, following its BaseId chain back to the
+    last revision stored in full and applying the deltas forward; None if there is no such row.
+    """
+    deltas = []
+    row = _read_revision(conn, revision_id)
+    while row is not None and row[0] is None and row[2] is not None:
+        deltas.append(bytes(row[2]))
+        row = _read_revision(conn, row[1])
+        if row is None:
+            raise ValueError(f"The base revision of post_history {revision_id} is missing")
+    if row is None:
+        return None
+    if not deltas:
+        return row[0]
+    text = row[0].encode('utf-8')
+    for delta in reversed(deltas):
+        text = decompress_revision(delta, text)
+    return text.decode('utf-8')
@@ -0,0 +1,175 @@
+import re
+from schema import TABLES, CONVERTERS
+
+# Regular expressions to match the <row> elements and capture their attributes
+ROW_REGEX = re.compile(r'<row ([^>]+)>')
+ATTRIBUTE_REGEX = re.compile(r'(\S+)="([^"]*)"')
+# The same on raw lines, so only the values of known columns are decoded
+ROW_BYTES_REGEX = re.compile(rb'<row ([^>]+)>')
+ATTRIBUTE_BYTES_REGEX = re.compile(rb'(\S+)="([^"]*)"')
+
+# The named entities and line breaks of the dump, decoded with plain replaces; `&amp;` goes last
+_XML_ENTITIES = (('&lt;', '<'), ('&gt;', '>'), ('&quot;', '"'), ('&apos;', "'"), ('&#xA;', '\n'), ('&#xD;', '\r'))
+_CHARACTER_REFERENCE = re.compile(r'&(?:#x([0-9a-fA-F]+)|#([0-9]+)|amp);')
+# Between the names of a Tags value: `<a><b>` and `|a|b|` in the dumps, `a, b` in posts.Tags
+_TAG_SEPARATOR = re.compile(r'><|[|,]\s*')
+
+# Row parsers per (table, engine), built on first use
+_ROW_PARSERS = {}
+
+def parse_attributes(line):
+    """Return the attributes of a `<row>` line as a dictionary of raw (still XML-escaped) values, or None."""
+    match = ROW_REGEX.search(line)
+    if match:
+        return dict(ATTRIBUTE_REGEX.findall(match.group(1)))
+    return None
+
+def _decode_reference(match):
+    hexadecimal, decimal = match.groups()
+    if hexadecimal:
+        return chr(int(hexadecimal, 16))
+    if decimal:
+        return chr(int(decimal))
+    return '&'
+
+def xml_unescape(value):
+    """Decode the XML entities of an attribute value."""
+    for entity, character in _XML_ENTITIES:
+        if entity in value:
+            value = value.replace(entity, character)
+    if '&' in value:
+        if '&#' in value:
+            # Decode the remaining character references and `&amp;` in one pass, so `&#38;amp;` stays `&amp;`
+            return _CHARACTER_REFERENCE.sub(_decode_reference, value)
+        return value.replace('&amp;', '&')
+    return value
+
+def tag_names(tags):
+    """Return the tag names of a decoded Tags value, `<a><b>`, `|a|b|` or `a, b`, in order."""
+    return [name for name in _TAG_SEPARATOR.split(tags.strip('<>|')) if name]
+
+def _column_layout(table, projection=None):
+    """
+    Return the position of every column to fill, the row of default values and the converter
+    of every position. Columns left out of a `projection` are not parsed and stay None.
+    """
+    columns = TABLES[table]
+    index = {name: position for position, (name, _, _) in enumerate(columns) if projection is None or name in projection}
+    defaults = [default if projection is None or name in projection else None for name, _, default in columns]
+    # Text needs no conversion
+    converters = [None if column_type == 'text' else CONVERTERS[column_type] for _, column_type, _ in columns]
+    return index, defaults, converters
+
+def _regex_row_parser(table, projection=None):
+    index, defaults, converters = _column_layout(table, projection)
+    byte_index = {name.encode('ascii'): position for name, position in index.items()}
+
+    def parse_bytes(line):
+        match = ROW_BYTES_REGEX.search(line)
+        if not match:
+            return None
+        row = defaults.copy()
+        for name, value in ATTRIBUTE_BYTES_REGEX.findall(match.group(1)):
+            position = byte_index.get(name)
+            if position is not None:
+                convert = converters[position]
+                if convert is int:
+                    # int() reads the ASCII digits without decoding
+                    row[position] = int(value)
+                    continue
+                value = value.decode('utf-8', errors='replace')
+                if '&' in value:
+                    value = xml_unescape(value)
+                row[position] = convert(value) if convert else value
+        return row
+
+    def parse(line):
+        if isinstance(line, bytes):
+            return parse_bytes(line)
+        match = ROW_REGEX.search(line)
+        if not match:
+            return None
+        row = defaults.copy()
+        for name, value in ATTRIBUTE_REGEX.findall(match.group(1)):
+            position = index.get(name)
+            if position is not None:
+                if '&' in value:
+                    value = xml_unescape(value)
+                convert = converters[position]
+                row[position] = convert(value) if convert else value
+        return row
+
+    return parse
+
+def _expat_row_parser(table, projection=None):
+    # Import pyexpat directly: the local xml.py shadows the standard xml package
+    import pyexpat
+    index, defaults, converters = _column_layout(table, projection)
+
+    def parse(line):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if '<row' not in line:
+            return None
+        row = None
+
+        def start_element(name, attributes):
+            nonlocal row
+            if name == 'row':
+                row = defaults.copy()
+                # With ordered_attributes the attributes come as a flat [name, value, ...] list
+                for i in range(0, len(attributes), 2):
+                    position = index.get(attributes[i])
+                    if position is not None:
+                        convert = converters[position]
+                        row[position] = convert(attributes[i + 1]) if convert else attributes[i + 1]
+
+        parser = pyexpat.ParserCreate()
+        parser.ordered_attributes = True
+        parser.StartElementHandler = start_element
+        parser.Parse(line.strip(), True)
+        return row
+
+    return parse
+
+def _lxml_row_parser(table, projection=None):
+    from lxml import etree
+    index, defaults, converters = _column_layout(table, projection)
+
+    def parse(line):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', errors='replace')
+        if '<row' not in line:
+            return None
+        row = defaults.copy()
+        for name, value in etree.fromstring(line.strip()).attrib.items():
+            position = index.get(name)
+            if position is not None:
+                convert = converters[position]
+                row[position] = convert(value) if convert else value
+        return row
+
+    return parse
+
+ENGINES = {
+    'regex': _regex_row_parser,
+    'expat': _expat_row_parser,
+    'lxml': _lxml_row_parser,
+}
+
+def get_row_parser(table, engine='regex', projection=None):
+    """
+    Return a function that parses a line of the dump (text, or raw UTF-8 bytes which are
+    decoded with replacement characters) into a list of unescaped attribute
+    values, converted to their column types, in the column order of `schema.TABLES[table]`,
+    or None if it is not a `<row>` line.
+    `regex` uses precompiled patterns, `expat` the standard expat parser and `lxml` needs lxml.
+    With a `projection` (a tuple of column names) only those columns are filled.
+    """
+    key = (table, engine, projection)
+    parser = _ROW_PARSERS.get(key)
+    if parser is None:
+        if engine not in ENGINES:
+            raise ValueError(f"Unknown row parser: {engine}")
+        parser = _ROW_PARSERS[key] = ENGINES[engine](table, projection)
+    return parser
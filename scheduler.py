@@ -0,0 +1,159 @@
+import multiprocessing
+import os
+import queue
+import time
+from schema import XML_TYPES
+from reader import COMPRESSED_EXTENSIONS
+
+def table_of_file(path):
+    """
+    Return the type (see `schema.XML_TYPES`) of a dump file from its name, e.g. Posts for
+    `Posts.xml`, `posts.xml.bz2` or `stackoverflow.com-Posts.7z`, or None.
+    """
+    name = os.path.basename(path)
+    for extension in COMPRESSED_EXTENSIONS + ('.xml',):
+        if name.lower().endswith(extension):
+            name = name[:-len(extension)]
+    # Archives of the Stack Exchange dump are named after the site, e.g. stackoverflow.com-Posts
+    name = name.rsplit('-', 1)[-1].lower()
+    for xml_type in XML_TYPES:
+        if xml_type.lower() == name:
+            return xml_type
+    return None
+
+def plan_imports(paths):
+    """
+    Return the (path, type, size) of the dump files with a known type, largest file first,
+    one file per type: of several files of a type the plain `.xml` is imported, e.g. the
+    one extracted next to its `.7z`. Raises ValueError if there is no single plain file.
+    """
+    files = {}
+    for path in paths:
+        xml_type = table_of_file(path)
+        if xml_type:
+            files.setdefault(xml_type, []).append(path)
+    plan = []
+    for xml_type, candidates in files.items():
+        if len(candidates) > 1:
+            plain = [path for path in candidates if path.lower().endswith('.xml')]
+            if len(plain) != 1:
+                raise ValueError(f"Several dump files of {xml_type}, keep only one of them: {', '.join(sorted(candidates))}")
+            candidates = plain
+        plan.append((candidates[0], xml_type, os.path.getsize(candidates[0])))
+    plan.sort(key=lambda item: item[2], reverse=True)
+    return plan
+
+def import_worker(tasks, results, convert_to_md, options):
+    """
+    Import files from the `tasks` queue until it hands out None, on one connection that
+    is opened once and reused for every file of this worker.
+    """
+    from api import process_xml_file
+    from database import open_connection, close_connection, connection_alive
+    conn = open_connection(options.get('bulk', False), options.get('journal_mode', 'WAL'))
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            path, xml_type = task
+            started_at = time.perf_counter()
+            completed = process_xml_file(path, xml_type, 1, convert_to_md, conn=conn, label=xml_type, finish_bulk=False, **options)
+            if not completed:
+                try:
+                    # Leave the connection usable for the next file
+                    conn.rollback()
+                except Exception:
+                    pass
+            if not connection_alive(conn):
+                # The import lost it (and went on over a connection of its own)
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                conn = open_connection(options.get('bulk', False), options.get('journal_mode', 'WAL'))
+            results.put((path, xml_type, completed, time.perf_counter() - started_at))
+    finally:
+        close_connection(conn)
+
+def import_all(input_folder, jobs=None, convert_to_md=True, **options):
+    """
+    Import every dump file of a folder (see `utils.list_xml_files`) into the table named by
+    the file, with `jobs` worker processes importing one file each at a time. Files are
+    handed out largest first, so the whole import takes about as long as the largest file.
+    `options` are passed on to `api.process_xml_file`. Returns the (path, type, completed,
+    seconds) of every file.
+    """
+    from colored import fg, attr
+    from utils import list_xml_files
+    from database import get_dbms, open_connection, close_connection, create_tables, create_fulltext, build_fulltext_indexes, finish_bulk_load, resolve_pending_tags
+    green = fg('green')
+    red = fg('red')
+    cyan = fg('cyan')
+    reset = attr('reset')
+
+    paths = list_xml_files(input_folder)
+    try:
+        plan = plan_imports(paths)
+    except ValueError as e:
+        print(f"{red}{e}{reset}")
+        return []
+    if not plan:
+        print(f"{red}No dump files of a known type ({', '.join(XML_TYPES)}) in {input_folder}.{reset}")
+        return []
+    jobs = min(jobs or os.cpu_count() or 1, len(plan))
+    if get_dbms() == 'DUCKDB' and jobs > 1:
+        # A DuckDB file can only be opened by one process for writing
+        print(f"{cyan}DUCKDB has a single writer, importing one file at a time.{reset}")
+        jobs = 1
+    for path, xml_type, size in plan:
+        print(f"{cyan}    {xml_type:<10} {size / 1e9:>8.2f} GB  {path}{reset}")
+    planned = {path for path, _, _ in plan}
+    for path in paths:
+        if table_of_file(path) and path not in planned:
+            print(f"{cyan}    Skipping {path}, the plain .xml file of {table_of_file(path)} is imported instead{reset}")
+
+    bulk = options.get('bulk', False)
+    # Create the tables once before the workers start writing to them
+    conn = open_connection(bulk, options.get('journal_mode', 'WAL'))
+    create_tables(conn)
+    if options.get('fulltext'):
+        create_fulltext(conn)
+    close_connection(conn)
+
+    started_at = time.perf_counter()
+    tasks = multiprocessing.Queue()
+    results = multiprocessing.Queue()
+    for path, xml_type, _ in plan:
+        tasks.put((path, xml_type))
+    for _ in range(jobs):
+        tasks.put(None)
+    # Not a Pool: its daemonic processes could not start the --workers of an import
+    processes = [multiprocessing.Process(target=import_worker, args=(tasks, results, convert_to_md, options)) for _ in range(jobs)]
+    for process in processes:
+        process.start()
+    summary = []
+    while len(summary) < len(plan) and any(process.is_alive() for process in processes):
+        try:
+            summary.append(results.get(timeout=1))
+        except queue.Empty:
+            pass
+    for process in processes:
+        process.join()
+    while not results.empty():
+        summary.append(results.get())
+
+    conn = open_connection()
+    # Posts and Tags may finish in any order; move the tags that were still pending
+    resolve_pending_tags(conn)
+    if options.get('fulltext'):
+        build_fulltext_indexes(conn)
+    if bulk:
+        finish_bulk_load(conn)
+    close_connection(conn)
+
+    print(f"\n{green}Imported {sum(1 for item in summary if item[2])} of {len(plan)} files with {jobs} workers in {time.perf_counter() - started_at:.1f}s:{reset}")
+    for path, xml_type, completed, seconds in summary:
+        color = green if completed else red
+        print(f"{color}    {xml_type:<10} {'done' if completed else 'FAILED'} in {seconds:.1f}s  {path}{reset}")
+    return summary
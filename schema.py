@@ -0,0 +1,170 @@
+from datetime import datetime
+
+# Columns of every destination table in insert order: the name, the type the XML value
+# is converted to while parsing (see `CONVERTERS`) and the value used when the attribute
+# is missing from the XML row. `Id` is the primary key unless `PRIMARY_KEYS` says otherwise.
+TABLES = {
+    'posts': (
+        ('Id', 'int', None), ('PostTypeId', 'int', None), ('AcceptedAnswerId', 'int', None),
+        ('CreationDate', 'datetime', None), ('Score', 'int', None), ('ViewCount', 'int', None),
+        ('Body', 'text', None), ('OwnerUserId', 'int', None), ('LastEditorUserId', 'int', None),
+        ('LastEditorDisplayName', 'text', None), ('LastEditDate', 'datetime', None),
+        ('LastActivityDate', 'datetime', None), ('Title', 'text', None),
+        ('Tags', 'text', None), ('AnswerCount', 'int', None), ('CommentCount', 'int', None),
+        ('FavoriteCount', 'int', None), ('CommunityOwnedDate', 'datetime', None),
+        ('ContentLicense', 'text', None), ('Error', 'bool', None),
+        ('ParentId', 'int', None), ('ClosedDate', 'datetime', None),
+        ('OwnerDisplayName', 'text', None),
+    ),
+    'comments': (
+        ('Id', 'int', 0), ('PostId', 'int', 0), ('Score', 'int', 0),
+        ('Text', 'text', None), ('CreationDate', 'datetime', None),
+        ('UserId', 'int', 0), ('ContentLicense', 'text', None),
+        ('Error', 'bool', None),
+        ('UserDisplayName', 'text', None),
+    ),
+    'postlinks': (
+        ('Id', 'int', 0), ('CreationDate', 'datetime', None),
+        ('PostId', 'int', 0), ('RelatedPostId', 'int', 0),
+        ('LinkTypeId', 'int', 0),
+    ),
+    'tags': (
+        ('Id', 'int', 0), ('TagName', 'text', None),
+        ('Count', 'int', 0), ('ExcerptPostId', 'int', 0),
+        ('WikiPostId', 'int', 0),
+        ('IsModeratorOnly', 'bool', None), ('IsRequired', 'bool', None),
+    ),
+    'users': (
+        ('Id', 'int', 0), ('Reputation', 'int', 0),
+        ('CreationDate', 'datetime', None), ('DisplayName', 'text', None),
+        ('LastAccessDate', 'datetime', None),
+        ('AboutMe', 'text', None),
+        ('Views', 'int', 0), ('UpVotes', 'int', 0),
+        ('DownVotes', 'int', 0), ('Error', 'bool', None),
+        ('Location', 'text', None), ('WebsiteUrl', 'text', None),
+        ('AccountId', 'int', None),
+    ),
+    'votes': (
+        ('Id', 'int', None), ('PostId', 'int', 0),
+        ('VoteTypeId', 'int', 0), ('CreationDate', 'datetime', None),
+        ('UserId', 'int', None), ('BountyAmount', 'int', None),
+    ),
+    # BaseId and TextDelta are not in the dump; they hold the Text of a revision stored as a
+    # delta against an earlier one when importing with compact history (see revisions.py)
+    'post_history': (
+        ('Id', 'int', None), ('PostHistoryTypeId', 'int', None), ('PostId', 'int', None),
+        ('RevisionGUID', 'text', None), ('CreationDate', 'datetime', None),
+        ('UserId', 'int', None), ('UserDisplayName', 'text', None),
+        ('Comment', 'text', None), ('Text', 'text', None),
+        ('ContentLicense', 'text', None),
+        ('BaseId', 'int', None), ('TextDelta', 'bytes', None),
+    ),
+    'badges': (
+        ('Id', 'int', None), ('UserId', 'int', None), ('Name', 'text', None),
+        ('Date', 'datetime', None), ('Class', 'int', None), ('TagBased', 'bool', None),
+    ),
+    # Per-post counters computed while Votes and Comments are imported (see stats.py), one
+    # row per post and shard of the import; sharded imports merge them into shard 0
+    'post_vote_stats': (
+        ('PostId', 'int', None), ('Shard', 'int', None),
+        ('UpVotes', 'int', 0), ('DownVotes', 'int', 0), ('AcceptedVotes', 'int', 0),
+        ('Favorites', 'int', 0), ('OtherVotes', 'int', 0),
+    ),
+    'post_comment_stats': (
+        ('PostId', 'int', None), ('Shard', 'int', None),
+        ('Comments', 'int', 0), ('CommentScore', 'int', 0),
+    ),
+    # The byte offset up to which the rows of a table (and shard) are counted in the stats tables
+    'stats_offsets': (
+        ('TableName', 'text', None), ('Shard', 'int', None), ('ByteOffset', 'bigint', None),
+    ),
+    # The tags of every post, filled by the Posts import from `posts.Tags`
+    'post_tags': (
+        ('PostId', 'int', None), ('TagId', 'int', None),
+    ),
+    # Tags of posts whose name is not in the tags table yet; they move to post_tags once Tags is imported
+    'post_tags_pending': (
+        ('PostId', 'int', None), ('TagName', 'text', None),
+    ),
+    # Content hash of every row written by a delta import (see delta.py)
+    'row_hashes': (
+        ('TableName', 'text', None), ('Id', 'int', None), ('Hash', 'bigint', None),
+    ),
+    # The latest LastActivityDate of the tables that have one, as of the last delta import
+    'delta_watermarks': (
+        ('TableName', 'text', None), ('Watermark', 'datetime', None),
+    ),
+}
+
+# Tables keyed by something else than `Id`
+PRIMARY_KEYS = {
+    'post_tags': ('PostId', 'TagId'),
+    'post_tags_pending': ('PostId', 'TagName'),
+    'row_hashes': ('TableName', 'Id'),
+    'delta_watermarks': ('TableName',),
+    'post_vote_stats': ('PostId', 'Shard'),
+    'post_comment_stats': ('PostId', 'Shard'),
+    'stats_offsets': ('TableName', 'Shard'),
+}
+
+# Tables of counters: writing a row whose key is already stored adds to the stored values
+ADDITIVE_TABLES = ('post_vote_stats', 'post_comment_stats')
+
+def parse_bool(value):
+    return value.lower() == 'true'
+
+# Functions converting a decoded XML value to the type of its column
+CONVERTERS = {
+    'int': int,
+    'bigint': int,
+    'bool': parse_bool,
+    'datetime': datetime.fromisoformat,
+    'text': str,
+    'bytes': str.encode,
+}
+
+# Maps the type selected in the CLI (the name of the dump file) to its table
+XML_TYPES = {
+    'Votes': 'votes',
+    'Users': 'users',
+    'Tags': 'tags',
+    'PostLinks': 'postlinks',
+    'Posts': 'posts',
+    'Comments': 'comments',
+    'PostHistory': 'post_history',
+    'Badges': 'badges',
+}
+
+# Columns holding HTML that is converted to Markdown; the result of the conversion sets the Error column
+MARKDOWN_COLUMNS = {
+    'posts': 'Body',
+    'comments': 'Text',
+    'users': 'AboutMe',
+}
+
+# Columns indexed for full-text search by `--fulltext`, the most important first (see `database.create_fulltext`)
+FULLTEXT_COLUMNS = {
+    'posts': ('Title', 'Body'),
+    'comments': ('Text',),
+}
+
+def column_names(table):
+    """Return the column names of the given table in insert order."""
+    return [name for name, _, _ in TABLES[table]]
+
+def column_types(table):
+    """Return the (name, type) pairs of the columns of the given table in insert order."""
+    return [(name, column_type) for name, column_type, _ in TABLES[table]]
+
+def primary_key(table):
+    """Return the primary key columns of the given table."""
+    return PRIMARY_KEYS.get(table, ('Id',))
+
+def column_index(table, name):
+    """Return the position of a column in the insert tuple of a table."""
+    return _COLUMN_INDEXES[table][name]
+
+_COLUMN_INDEXES = {
+    table: {name: position for position, (name, _, _) in enumerate(columns)}
+    for table, columns in TABLES.items()
+}
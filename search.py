@@ -0,0 +1,62 @@
+from database import get_dbms, get_cursor, get_place_holder
+from schema import FULLTEXT_COLUMNS
+
+def fts5_query(query):
+    """Quote every word of a keyword query, so FTS5 matches rows with all of them instead of reading its query syntax."""
+    return ' '.join('"' + word.replace('"', '""') + '"' for word in query.split())
+
+def search(conn, query, limit=20, table='posts'):
+    """
+    Return the Ids of the posts best matching all words of `query`, best first, using the
+    index created by `--fulltext` (see `database.create_fulltext`). With `table='comments'`
+    the comments are searched and the Ids of the posts they belong to are returned.
+    Words are stemmed in English on both DBMS, so `parsing` also finds `parse`.
+    `limit=None` returns all matches.
+    """
+    if table not in FULLTEXT_COLUMNS:
+        raise ValueError(f"No full-text index on {table}")
+    if not query.split():
+        return []
+    cursor = get_cursor(conn)
+    post_id = 'PostId' if table == 'comments' else 'Id'
+    if get_dbms() == 'SQLITE':
+        # A negative LIMIT is no limit on SQLITE, LIMIT NULL on POSTGRES
+        limit = -1 if limit is None else limit
+        # bm25 is lower for better matches; the first column weighs ten times the others
+        weights = ', '.join(['10.0'] + ['1.0'] * (len(FULLTEXT_COLUMNS[table]) - 1))
+        if table == 'posts':
+            cursor.execute(f"SELECT rowid FROM posts_fts WHERE posts_fts MATCH ? ORDER BY bm25(posts_fts, {weights}) LIMIT ?", (fts5_query(query), limit))
+        else:
+            # bm25 cannot be used once the query is flattened into the join, so the matches are materialized first
+            cursor.execute(f'''
+    WITH matches AS MATERIALIZED (
+        SELECT rowid, bm25({table}_fts, {weights}) AS rank FROM {table}_fts WHERE {table}_fts MATCH ?
+    )
+    SELECT t.{post_id} FROM matches JOIN {table} t ON t.Id = matches.rowid
+    GROUP BY t.{post_id} ORDER BY MIN(matches.rank) LIMIT ?
+    ''', (fts5_query(query), limit))
+    elif get_dbms() == 'POSTGRES':
+        cursor.execute(f'''
+    SELECT {post_id} FROM {table}, websearch_to_tsquery('english', %s) query
+    WHERE SearchVector @@ query
+    GROUP BY {post_id} ORDER BY MAX(ts_rank(SearchVector, query)) DESC LIMIT %s
+    ''', (query, limit))
+    else:
+        raise ValueError(f"Full-text search is only supported on SQLITE and POSTGRES, not DBMS={get_dbms()}")
+    return [row[0] for row in cursor.fetchall()]
+
+def search_like(conn, query, limit=20, table='posts'):
+    """The unindexed baseline of `search`: the posts containing every word of `query` with a case insensitive LIKE scan, unranked."""
+    cursor = get_cursor(conn)
+    post_id = 'PostId' if table == 'comments' else 'Id'
+    operator = 'ILIKE' if get_dbms() == 'POSTGRES' else 'LIKE'
+    place_holder = get_place_holder()
+    if get_dbms() == 'SQLITE' and limit is None:
+        limit = -1
+    conditions = []
+    parameters = []
+    for word in query.split():
+        conditions.append('(' + ' OR '.join(f"{name} {operator} {place_holder}" for name in FULLTEXT_COLUMNS[table]) + ')')
+        parameters.extend([f'%{word}%'] * len(FULLTEXT_COLUMNS[table]))
+    cursor.execute(f"SELECT DISTINCT {post_id} FROM {table} WHERE {' AND '.join(conditions)} LIMIT {place_holder}", (*parameters, limit))
+    return [row[0] for row in cursor.fetchall()]
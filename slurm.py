@@ -0,0 +1,46 @@
+import os
+import re
+
+def write_slurm_array_script(template_path, output_path, input_file_path, destination_table, shards):
+    """
+    Write a variant of the Slurm job script that imports one file as a job array,
+    one array task per shard. Every task passes its SLURM_ARRAY_TASK_ID as the shard index.
+    """
+    with open(template_path, 'r', encoding='utf-8') as file:
+        script = file.read()
+
+    # One array task per shard, each with its own log files
+    script = script.replace('#SBATCH --ntasks=1\n', f'#SBATCH --ntasks=1\n#SBATCH --array=0-{shards - 1}\n', 1)
+    script = re.sub(r'_%j\.log', '_%A_%a.log', script)
+
+    script = re.sub(r'--input_file_path \S+', f'--input_file_path {input_file_path}', script)
+    script = re.sub(r'--destination_table \S+', f'--destination_table {destination_table}', script)
+    script = re.sub(r'--resume \\\n', f'--resume \\\\\n  --shards {shards} \\\\\n  --shard_index $SLURM_ARRAY_TASK_ID \\\\\n', script)
+
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write(script)
+    return output_path
+
+def finish_script_path(array_script_path):
+    root, extension = os.path.splitext(array_script_path)
+    return f"{root}_finish{extension or '.slurm'}"
+
+def write_slurm_finish_script(template_path, array_script_path, input_file_path, destination_table, shards):
+    """
+    Write the job script that runs --finish_shards after the array job of
+    `write_slurm_array_script`, next to it; submit it with a dependency on the array job.
+    """
+    with open(template_path, 'r', encoding='utf-8') as file:
+        script = file.read()
+
+    script = re.sub(r'_%j\.log', '_finish_%j.log', script)
+    script = re.sub(r'--input_file_path \S+', f'--input_file_path {input_file_path}', script)
+    script = re.sub(r'--destination_table \S+', f'--destination_table {destination_table}', script)
+    # Only the finishing step; the other options stay, so a --bulk or --fulltext import is finished as such
+    script = re.sub(r'--resume \\\n', f'--shards {shards} \\\\\n  --finish_shards \\\\\n', script)
+    script = re.sub(r'# --resume continues.*\n?', '', script)
+
+    output_path = finish_script_path(array_script_path)
+    with open(output_path, 'w', encoding='utf-8') as file:
+        file.write(script)
+    return output_path
@@ -0,0 +1,101 @@
+from schema import TABLES, column_index, primary_key
+
+# The stats table counted while a table is imported
+STATS_TABLES = {'votes': 'post_vote_stats', 'comments': 'post_comment_stats'}
+
+# The counter of post_vote_stats by VoteTypeId; other types are counted in OtherVotes
+VOTE_COUNTERS = {2: 'UpVotes', 3: 'DownVotes', 1: 'AcceptedVotes', 5: 'Favorites'}
+
+# The columns of the imported rows the counters are computed from
+STATS_SOURCE_COLUMNS = {'votes': ('PostId', 'VoteTypeId'), 'comments': ('PostId', 'Score')}
+
+def counter_names(table):
+    """The counter columns of a stats table, in table order."""
+    return tuple(name for name, _, _ in TABLES[table] if name not in primary_key(table))
+
+class PostStats:
+    """
+    Counts the votes by type or the comments (and their total score) of every post while
+    Votes or Comments are imported, so the stats tables need no GROUP BY over the imported
+    rows afterwards. Counters are kept in a dict of PostId -> list of counts and written
+    with `write` once `max_posts` posts are counted and at the end of the file; stats
+    tables add the written counts to the stored ones (see `schema.ADDITIVE_TABLES`).
+    The rows counted since the last commit are kept in `uncommitted`, so a restart from the
+    last checkpoint can take their counts back with the rolled back rows.
+    """
+
+    def __init__(self, source, shard_index=0, max_posts=500000):
+        self.source = source
+        self.table = STATS_TABLES[source]
+        self.shard_index = shard_index
+        self.max_posts = max_posts
+        self.names = counter_names(self.table)
+        self.counters = {}
+        self.uncommitted = []
+        # The number of posts whose counters are added to the writer but not committed yet
+        self.written = None
+        # Rows before this byte offset were counted by an earlier run (see `database.read_stats_offset`)
+        self.counted_until = 0
+        self.written_posts = 0
+        self._post_id = column_index(source, 'PostId')
+        if source == 'votes':
+            self._type = column_index(source, 'VoteTypeId')
+            self._other = self.names.index('OtherVotes')
+            self._slots = {type_id: self.names.index(name) for type_id, name in VOTE_COUNTERS.items()}
+        else:
+            self._score = column_index(source, 'Score')
+
+    def add(self, row):
+        """Count a parsed row tuple of the source table."""
+        post_id = row[self._post_id]
+        if post_id is None:
+            return
+        counts = self.counters.get(post_id)
+        if counts is None:
+            counts = self.counters[post_id] = [0] * len(self.names)
+        if self.source == 'votes':
+            counts[self._slots.get(row[self._type], self._other)] += 1
+        else:
+            counts[0] += 1
+            counts[1] += row[self._score] or 0
+        self.uncommitted.append(row)
+
+    def full(self):
+        return self.written is None and len(self.counters) >= self.max_posts
+
+    def write(self, writer, byte_offset=None):
+        """
+        Add the counters and the byte offset they cover to the writer without committing in
+        between; the caller's next commit makes both durable and then calls `committed`.
+        """
+        rows = [(post_id, self.shard_index, *counts) for post_id, counts in self.counters.items()]
+        writer.add_all(self.table, rows)
+        if byte_offset is not None:
+            writer.add_all('stats_offsets', [(self.source, self.shard_index, byte_offset)])
+        self.written = len(rows)
+
+    def committed(self):
+        """Keep the counts of the rows just committed, or start from zero once the counters were committed with them."""
+        if self.written is not None:
+            self.written_posts += self.written
+            self.counters = {}
+            self.written = None
+        self.uncommitted = []
+
+    def discard(self):
+        """
+        Take back the counts of the rows counted since the last commit, e.g. when an import
+        restarts from its last checkpoint; written counters that were rolled back are written again.
+        """
+        for row in self.uncommitted:
+            post_id = row[self._post_id]
+            counts = self.counters[post_id]
+            if self.source == 'votes':
+                counts[self._slots.get(row[self._type], self._other)] -= 1
+            else:
+                counts[0] -= 1
+                counts[1] -= row[self._score] or 0
+            if not any(counts):
+                del self.counters[post_id]
+        self.uncommitted = []
+        self.written = None
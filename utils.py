@@ -1,75 +1,144 @@
 
 from colored import fg, attr
+from collections import OrderedDict
 from html import unescape
+import hashlib
+import time
 import markdownify
 import html2text
 import re
+from rowparser import tag_names
+
+# The `[code]` and `[/code]` lines html2text writes around code blocks (mark_code)
+CODE_MARK_REGEX = re.compile(r'^\[/?code\]\s*$', flags=re.MULTILINE)
 
 def remove_nul_characters(text):
     """Remove NUL (0x00) characters from a string."""
     return text.replace('\x00', '')
 
 def remove_surrogates(text):
-    # Remove surrogate characters from a string
-    return ''.join(char for char in text if not 0xD800 <= ord(char) <= 0xDFFF)
+    # Remove surrogate characters from a string; they are the only characters UTF-8 cannot encode
+    if text.isascii():
+        return text
+    return text.encode('utf-8', 'ignore').decode('utf-8')
 
 def tags_to_comma_separated(tag_string):
     # Decode HTML entities to get the actual characters ("<", ">")
     decoded_tag_string = tag_string.replace("&lt;", "<").replace("&gt;", ">")
 
-    # Split the string into individual tags, remove the angle brackets, then join with commas
-    tags = decoded_tag_string.strip("<>").split("><")
-    comma_separated_tags = ", ".join(tags)
-    
-    return comma_separated_tags
+    # Split the string into individual tags (`<a><b>` or `|a|b|`), then join with commas
+    return ", ".join(tag_names(decoded_tag_string))
 
 def html_to_markdown1(html):
     return remove_surrogates(remove_nul_characters(markdownify.markdownify(unescape(html), heading_style="ATX")))
 
-def html_to_markdown2(encoded_html):
-    # Decode HTML entities
-    html = unescape(encoded_html)
-
-    # Initialize html2text
-    text_maker = html2text.HTML2Text()
-    text_maker.ignore_links = False
-    text_maker.ignore_images = True
-    text_maker.ignore_emphasis = False
-    text_maker.ignore_tables = False
-    text_maker.mark_code = True
-    text_maker.body_width = 0
-    text_maker.skip_internal_links = True
-
-    error = False
-    try:
-        # Convert HTML to Markdown
-        markdown = text_maker.handle(html)
-        # Clean up code blocks if necessary (this step may not be needed with html2text, but included for completeness)
-        markdown = re.sub(r'^\[code\]\s*$', '```', markdown, flags=re.MULTILINE)
-        markdown = re.sub(r'^\[/code\]\s*$', '```', markdown, flags=re.MULTILINE)
-    except Exception as e:
-        print(f"An error occurred during HTML to Markdown conversion: {e}")    
-        markdown = html
-        error = True
-
-    return remove_surrogates(remove_nul_characters(markdown)), error
+class MarkdownConverter:
+    """
+    Converts HTML to Markdown with one configured html2text converter that is reset and
+    reused for every text, instead of building a new one per row. Results of short texts,
+    which repeat a lot (boilerplate comments, AboutMe texts), are kept in a bounded LRU
+    cache keyed by a hash of the HTML. Every process has its own converter.
+    """
+
+    def __init__(self, cache_size=10000, max_cached_length=2048):
+        self.cache = OrderedDict()
+        self.cache_size = cache_size
+        self.max_cached_length = max_cached_length
+        self.hits = 0
+        self.misses = 0
+        # Time spent converting (cache misses)
+        self.seconds = 0.0
+
+        self.text_maker = html2text.HTML2Text()
+        self.text_maker.ignore_links = False
+        self.text_maker.ignore_images = True
+        self.text_maker.ignore_emphasis = False
+        self.text_maker.ignore_tables = False
+        self.text_maker.mark_code = True
+        self.text_maker.body_width = 0
+        self.text_maker.skip_internal_links = True
+        # The state of a freshly configured converter, restored before every conversion
+        self.initial_state = dict(self.text_maker.__dict__)
+
+    def reset(self):
+        state = self.text_maker.__dict__
+        for key, value in self.initial_state.items():
+            state[key] = value.copy() if isinstance(value, (list, dict)) else value
+
+    def convert(self, html):
+        """Convert decoded HTML to Markdown; returns the Markdown and whether the conversion failed."""
+        key = None
+        if len(html) <= self.max_cached_length:
+            key = hashlib.blake2b(html.encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+            cached = self.cache.get(key)
+            if cached is not None:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                return cached
+        self.misses += 1
+        started_at = time.perf_counter()
+
+        error = False
+        try:
+            self.reset()
+            # Convert HTML to Markdown
+            markdown = self.text_maker.handle(html)
+            # Replace the code block marks of html2text with Markdown fences
+            markdown = CODE_MARK_REGEX.sub('```', markdown)
+        except Exception as e:
+            print(f"An error occurred during HTML to Markdown conversion: {e}")
+            markdown = html
+            error = True
+
+        result = remove_surrogates(remove_nul_characters(markdown)), error
+        self.seconds += time.perf_counter() - started_at
+        if key is not None:
+            self.cache[key] = result
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return result
+
+    def counters(self):
+        """Return the cache hits, the misses and the seconds spent converting."""
+        return self.hits, self.misses, self.seconds
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+# The converter of this process, created on first use
+_markdown_converter = None
+
+def get_markdown_converter():
+    global _markdown_converter
+    if _markdown_converter is None:
+        _markdown_converter = MarkdownConverter()
+    return _markdown_converter
+
+def html_to_markdown2(encoded_html, unescape_entities=True):
+    # Decode HTML entities, unless the caller already decoded the XML attribute
+    html = unescape(encoded_html) if unescape_entities else encoded_html
+    return get_markdown_converter().convert(html)
 
 def list_xml_files(root_folder):
-    """Recursively list all XML files in the given root folder and its subfolders."""
+    """Recursively list all XML files, plain or compressed (.7z, .bz2, .gz, .zst), in the given root folder and its subfolders."""
     import os
+    from reader import is_compressed
     xml_files = []
     for root, dirs, files in os.walk(root_folder):
         for file in files:
-            if file.endswith('.xml'):
+            if file.endswith('.xml') or is_compressed(file):
                 xml_files.append(os.path.join(root, file))
     return xml_files
 
 def read_first_node(file_path):
     """Reads the file line by line and prints the first XML node."""
+    from reader import open_dump
     first_node_started = False
     node_lines = []
-    with open(file_path, 'r', encoding='utf-8') as file:
-        for line in file:
+    with open_dump(file_path) as file:
+        for raw_line in file:
+            line = raw_line.decode('utf-8', errors='replace')
             stripped_line = line.strip()
             if stripped_line.startswith('<?xml'):
                 continue  # Skip XML declaration
@@ -122,29 +191,24 @@ def read_yes_no(prompt_message):
         else:
             print(f"{red}Invalid input. Please enter 'Y' for Yes or 'N' for No.{reset}")
             
-def skip_to_line(file, line_number):
-    """Skip to the specified line number in the file and return the number of bytes passed."""
-    from colored import fg, attr
-    magenta = fg('magenta')
-    reset = attr('reset')
-    if line_number > 1:
-        print(f"{magenta}Skeeping to the start line ...{reset}")
-    bytes_passed = 0
-    for _ in range(line_number - 1):
-        line = next(file)
-        bytes_passed += len(line.encode('utf-8'))  # Assuming UTF-8 encoding for byte length calculation
-    return bytes_passed  
-
-def print_progress(current_bytes, total_bytes, last_printed_percent=None):
-    """Prints progress based on bytes processed, updating at each 1% increment of progress."""
-    from colored import fg, attr
-    magenta = fg('magenta')
-    reset = attr('reset')
+def print_progress(current_bytes, total_bytes, last_printed_percent=None, label=None):
+    """
+    Prints progress based on bytes processed, updating at each 1% increment of progress.
+    With a label (e.g. the shard of a parallel import) every update is printed on its own
+    line, so the progress of several processes sharing a terminal does not overwrite itself.
+    """
+    total_bytes = max(total_bytes, 1)
     percentage = int(100 * (current_bytes / total_bytes))  # Convert to int for whole number percentages
     if last_printed_percent is None or percentage > last_printed_percent:
+        # It is called for every line, so only build the colors when something is printed
+        magenta = fg('magenta')
+        reset = attr('reset')
         bar_length = 50  # Modify this to change the progress bar length
         progress_mark = int(bar_length * (current_bytes / total_bytes))
         bar = '[' + '#' * progress_mark + '-' * (bar_length - progress_mark) + ']'
-        print(f"{magenta}\rProgress: {percentage}% {bar}{reset}", end='', flush=True)
+        if label:
+            print(f"{magenta}{label} progress: {percentage}% {bar}{reset}", flush=True)
+        else:
+            print(f"{magenta}\rProgress: {percentage}% {bar}{reset}", end='', flush=True)
         return percentage  # Return the current percentage for tracking
     return last_printed_percent          
\ No newline at end of file